@@ -1,56 +1,303 @@
-import requests
+import io
 import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from response_cache import CachedResponse
+from tracing import TRACER
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+# The other endpoints (syncs, creations, deletions...) may have been applied when the response is lost: they are
+# retried only when the request was not sent, or refused with a Retry-After (throttled, in maintenance).
+MUTATION_RETRY_STATUS_CODES = [429, 503]
+# Read only endpoints, whose responses can be kept in the response cache:
+CACHED_PATHS = {
+    "/v1/workspaces/list",
+    "/v1/workspaces/get",
+    "/v1/workspaces/get_by_slug",
+    "/v1/workspaces/get_by_connection_id",
+    "/v1/sources/list",
+    "/v1/sources/get",
+    "/v1/sources/get_most_recent_source_actor_catalog",
+    "/v1/destinations/list",
+    "/v1/destinations/get",
+    "/v1/connections/list",
+    "/v1/connections/get",
+    "/v1/connections/list_all",
+    "/v1/sources/list_paginated",
+    "/v1/destinations/list_paginated",
+    "/v1/connections/list_paginated",
+    "/v1/connections/list_all_paginated",
+}
+MUTATING_ACTIONS = ("create", "update", "delete", "reset", "clone", "write_", "tag_")
+# Endpoints whose cached responses are invalidated by a mutation on a resource type,
+# e.g. deleting a source also deletes its connections:
+INVALIDATED_PATHS = {
+    "workspaces": ["/v1/workspaces/"],
+    "sources": ["/v1/sources/", "/v1/connections/"],
+    "destinations": ["/v1/destinations/", "/v1/connections/"],
+    "destination_definitions": ["/v1/destinations/", "/v1/connections/"],
+    "connections": ["/v1/connections/"],
+}
+
+
+# Items of the list resp.json()[key], parsed incrementally from the response body with ijson (see requirements.txt):
+# only the item being yielded is held in memory, not the whole list. Without ijson, the whole body is parsed.
+def iter_json_items(resp, key):
+    try:
+        try:
+            import ijson
+        except ImportError:
+            yield from resp.json()[key]
+            return
+        if isinstance(resp, CachedResponse):
+            body = io.BytesIO(resp.content)
+        else:
+            resp.raw.decode_content = True
+            body = resp.raw
+        yield from ijson.items(body, f"{key}.item", use_float=True)
+    finally:
+        resp.close()
+
+
+# Outcome of a bulk operation for one item: the result of the call, or the exception it raised.
+class BulkResult:
+    def __init__(self, item, result=None, error=None):
+        self.item = item
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return f"BulkResult({self.item!r}, error={self.error!r})" if self.error else f"BulkResult({self.item!r})"
+
+
+# Spaces the calls of all the threads by 1 / rate seconds at least.
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.lock = threading.Lock()
+        self.next_call = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            call_at = max(self.next_call, now)
+            self.next_call = call_at + self.interval
+        if call_at > now:
+            time.sleep(call_at - now)
+
+
+class AirbyteApiError(Exception):
+    def __init__(self, url_path, status_code, content):
+        super().__init__(f"{url_path}: {status_code}_{content}")
+        self.url_path = url_path
+        self.status_code = status_code
+        self.content = content
+
+
+# Retry of the mutating calls: on a status, only when the response has a Retry-After.
+class MutationRetry(Retry):
+    def is_retry(self, method, status_code, has_retry_after=False):
+        return has_retry_after and super().is_retry(method, status_code, has_retry_after)
+
+
+def make_session(client_id, client_secret, pool_size, retry):
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.auth = (client_id, client_secret)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 
 class AirbyteHelper:
-    def __init__(self, airbyte_base_url, client_id, client_secret):
+    def __init__(self, airbyte_base_url, client_id, client_secret, pool_size=10, connect_timeout=5, read_timeout=60,
+                 max_retries=3, backoff_factor=0.5, workspace_cache_ttl=300, response_cache=None, bypass_cache=False):
         self.airbyte_base_url = airbyte_base_url
         self.client_id = client_id
         self.client_secret = client_secret
+        self.timeout = (connect_timeout, read_timeout)
+        # Keep-alive connections reused by all the calls. The read only endpoints (CACHED_PATHS) are retried with
+        # exponential backoff on 429/5xx (and Retry-After) and read errors, the others only as far as it is safe:
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS_CODES,
+                      allowed_methods=None, raise_on_status=False)
+        mutation_retry = MutationRetry(total=max_retries, read=0, other=0, backoff_factor=backoff_factor,
+                                       status_forcelist=MUTATION_RETRY_STATUS_CODES, allowed_methods=None,
+                                       raise_on_status=False)
+        self.session = make_session(client_id, client_secret, pool_size, retry)
+        self.mutation_session = make_session(client_id, client_secret, pool_size, mutation_retry)
+        # Workspaces hardly ever change: the lookups are memoized for workspace_cache_ttl seconds.
+        self.workspace_cache_ttl = workspace_cache_ttl
+        self.workspace_cache = {}
+        # Optional ResponseCache of the read endpoints, see response_cache.py.
+        # With bypass_cache, the responses are always downloaded again (and the cache refreshed with them).
+        self.response_cache = response_cache
+        self.bypass_cache = bypass_cache
+
+    def close(self):
+        self.session.close()
+        self.mutation_session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_cached_workspace(self, key, load):
+        cached = self.workspace_cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        value = load()
+        self.workspace_cache[key] = (time.monotonic() + self.workspace_cache_ttl, value)
+        return value
+
+    def invalidate_workspace_cache(self):
+        self.workspace_cache.clear()
+
+    # Calls function on every item with max_workers threads, and at most rate_limit calls per second.
+    # Every item is processed whatever the failures: a BulkResult per item is returned, in the order of items.
+    def run_bulk(self, function, items, max_workers=8, rate_limit=None):
+        rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+
+        def run(item):
+            if rate_limiter is not None:
+                rate_limiter.wait()
+            try:
+                return BulkResult(item, result=function(item))
+            except Exception as e:
+                return BulkResult(item, error=e)
+
+        items = list(items)
+        if len(items) == 0:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+            return list(executor.map(run, items))
+
+    # With stream, the body is downloaded as it is read (unless it comes from the response cache).
+    def launch_request(self, url_path, data, stream=False):
+        if self.response_cache is not None:
+            if url_path in CACHED_PATHS:
+                return self.launch_cached_request(url_path, data)
+            self.invalidate_response_cache(url_path)
+        return self.post(url_path, data, stream=stream)
+
+    def post(self, url_path, data, headers=None, stream=False):
+        headers = dict(headers or {})
+        if data is not None and len(data.keys()) > 0:
+            headers['Content-type'] = 'application/json'
+        with TRACER.span(url_path, "http"):
+            session = self.session if url_path in CACHED_PATHS else self.mutation_session
+            resp = session.post(self.airbyte_base_url + "/api" + url_path, data=json.dumps(data),
+                                headers=headers, timeout=self.timeout, stream=stream)
+        if resp.status_code > 299 and resp.status_code != 304:
+            raise AirbyteApiError(url_path, resp.status_code, resp.content)
+        return resp
 
-    def launch_request(self, url_path, data):
-        if data is None or len(data.keys()) == 0:
-            headers = {}
+    # Fresh entries are used as is. Expired entries with an ETag are revalidated with If-None-Match.
+    def launch_cached_request(self, url_path, data):
+        key = self.response_cache.make_key(self.airbyte_base_url, url_path, data)
+        entry, content = (None, None) if self.bypass_cache else self.response_cache.get(key)
+        if content is not None:
+            return CachedResponse(content)
+        etag = entry.get("etag") if entry is not None else None
+        if etag is not None:
+            resp = self.post(url_path, data, headers={"If-None-Match": etag})
+            if resp.status_code == 304:
+                self.response_cache.refresh(key)
+                content = self.response_cache.get(key)[1]
+                if content is not None:
+                    return CachedResponse(content)
+                resp = self.post(url_path, data)
         else:
-            headers = {'Content-type': 'application/json'}
-        resp = requests.post(self.airbyte_base_url + "/api" + url_path, data=json.dumps(data), headers=headers,
-                             auth=(self.client_id, self.client_secret))
-        if resp.status_code > 299:
-            print(Exception(str(resp.status_code) + "_" + str(resp.content)))
-        return resp
+            resp = self.post(url_path, data)
+        self.response_cache.put(key, self.airbyte_base_url, url_path, resp.content, resp.headers.get("ETag"))
+        return CachedResponse(resp.content)
+
+    def invalidate_response_cache(self, url_path):
+        _, resource_type, action = url_path.split("/", 3)[1:]
+        if action.startswith(MUTATING_ACTIONS):
+            self.response_cache.invalidate(self.airbyte_base_url, INVALIDATED_PATHS.get(resource_type, []))
+
+    def iter_items(self, url_path, data, key):
+        return iter_json_items(self.launch_request(url_path, data, stream=True), key)
+
+    # Pages of page_size items from a list_paginated endpoint, requested one after the other
+    # until a page is not full.
+    def iter_pages(self, url_path, data, key, page_size):
+        row_offset = 0
+        while True:
+            count = 0
+            pagination = {"pageSize": page_size, "rowOffset": row_offset}
+            for item in self.iter_items(url_path, {**data, "pagination": pagination}, key):
+                count += 1
+                yield item
+            if count < page_size:
+                return
+            row_offset += page_size
+
+    # Without page_size, the whole list in one response (parsed incrementally);
+    # with page_size, from the list_paginated endpoint of the resource (recent Airbyte versions only).
+    def iter_resources(self, resource_type, workspace_id, page_size, list_action="list"):
+        if workspace_id is None:
+            workspace_id = self.get_first_workspace_id()
+        if page_size is None:
+            return self.iter_items(f"/v1/{resource_type}/{list_action}", {"workspaceId": workspace_id}, resource_type)
+        return self.iter_pages(
+            f"/v1/{resource_type}/{list_action}_paginated", {"workspaceIds": [workspace_id]}, resource_type, page_size
+        )
 
     # ======================================================================
     # Workspaces
     # ======================================================================
     def create_workspace(self, workspace):
         resp = self.launch_request("/v1/workspaces/create", workspace)
+        self.invalidate_workspace_cache()
         return resp.json()
 
     def delete_workspace(self, workspace_id):
         resp = self.launch_request("/v1/workspaces/delete", {"workspaceId": workspace_id})
+        self.invalidate_workspace_cache()
         return True
 
     def list_workspaces(self):
-        resp = self.launch_request("/v1/workspaces/list", {})
-        return resp.json()["workspaces"]
+        return self.get_cached_workspace(
+            ("list",), lambda: self.launch_request("/v1/workspaces/list", {}).json()["workspaces"]
+        )
 
     def get_workspace(self, workspace_id):
         resp = self.launch_request("/v1/workspaces/get", {"workspaceId": workspace_id})
         return resp.json()
 
     def get_workspace_by_slug(self, slug):
-        resp = self.launch_request("/v1/workspaces/get_by_slug", {"slug": slug})
-        return resp.json()
+        return self.get_cached_workspace(
+            ("slug", slug), lambda: self.launch_request("/v1/workspaces/get_by_slug", {"slug": slug}).json()
+        )
 
     def get_first_workspace_id(self):
         return self.list_workspaces()[0]["workspaceId"]
 
     def get_workspace_by_connection_id(self, connection_id):
-        resp = self.launch_request("/v1/workspaces/get_by_connection_id", {"connectionId": connection_id})
-        return resp.json()
+        return self.get_cached_workspace(
+            ("connection", connection_id),
+            lambda: self.launch_request("/v1/workspaces/get_by_connection_id", {"connectionId": connection_id}).json()
+        )
 
     def update_workspace(self, workspace):
         resp = self.launch_request("/v1/workspaces/update", workspace)
+        self.invalidate_workspace_cache()
         return resp.json()
 
     def update_workspace_name(self, workspace_id, new_name):
@@ -58,10 +305,12 @@ class AirbyteHelper:
             "workspaceId": workspace_id,
             "name": new_name
         })
+        self.invalidate_workspace_cache()
         return resp.json()
 
     def update_workspace_tag_feedback_status_as_done(self, workspace_id):
         resp = self.launch_request("/v1/workspaces/tag_feedback_status_as_done", {"workspaceId": workspace_id})
+        self.invalidate_workspace_cache()
         return resp.json()
 
     # ======================================================================
@@ -76,10 +325,10 @@ class AirbyteHelper:
         return resp.json()
 
     def list_sources(self, workspace_id=None):
-        if workspace_id is None:
-            workspace_id = self.list_workspaces()[0]["workspaceId"]
-        resp = self.launch_request("/v1/sources/list", {"workspaceId": workspace_id})
-        return resp.json()["sources"]
+        return list(self.iter_sources(workspace_id))
+
+    def iter_sources(self, workspace_id=None, page_size=None):
+        return self.iter_resources("sources", workspace_id, page_size)
 
     def get_source(self, source_id):
         resp = self.launch_request("/v1/sources/get", {"sourceId": source_id})
@@ -122,6 +371,12 @@ class AirbyteHelper:
         resp = self.launch_request("/v1/sources/write_discover_catalog_result", write_discover_catalog_result_body)
         return resp.json()
 
+    def delete_sources(self, source_ids, **bulk_options):
+        return self.run_bulk(self.delete_source, source_ids, **bulk_options)
+
+    def check_connection_sources(self, source_ids, **bulk_options):
+        return self.run_bulk(self.check_connection_source, source_ids, **bulk_options)
+
     # ======================================================================
     # Destinations
     # ======================================================================
@@ -135,10 +390,10 @@ class AirbyteHelper:
         return resp.json()
 
     def list_destinations(self, workspace_id=None):
-        if workspace_id is None:
-            workspace_id = self.list_workspaces()[0]["workspaceId"]
-        resp = self.launch_request("/v1/destinations/list", {"workspaceId": workspace_id})
-        return resp.json()["destinations"]
+        return list(self.iter_destinations(workspace_id))
+
+    def iter_destinations(self, workspace_id=None, page_size=None):
+        return self.iter_resources("destinations", workspace_id, page_size)
 
     def get_destination(self, destination_id):
         resp = self.launch_request("/v1/destinations/get", {"destinationId": destination_id})
@@ -164,14 +419,24 @@ class AirbyteHelper:
         resp = self.launch_request("/v1/destinations/clone", clone_body)
         return resp.json()
 
-    def delete_all_destinations(self, workspace_id=None):
+    def delete_destinations(self, destination_ids, **bulk_options):
+        return self.run_bulk(self.delete_destination, destination_ids, **bulk_options)
+
+    def check_connection_destinations(self, destination_ids, **bulk_options):
+        return self.run_bulk(self.check_connection_destination, destination_ids, **bulk_options)
+
+    def delete_all_destinations(self, workspace_id=None, **bulk_options):
         if workspace_id is None:
-            workspace_id = self.list_workspaces()[0]["workspaceId"]
-        print("Workspace ID", workspace_id)
-        destinations = self.list_destinations(workspace_id)
-        for destination in destinations:
-            print("deleting", destination["destinationId"])
-            self.delete_destination(destination["destinationId"])
+            workspace_id = self.get_first_workspace_id()
+        logger.info("Workspace ID %s", workspace_id)
+        destination_ids = [destination["destinationId"] for destination in self.list_destinations(workspace_id)]
+        results = self.delete_destinations(destination_ids, **bulk_options)
+        for result in results:
+            if result.ok:
+                logger.info("deleted %s", result.item)
+            else:
+                logger.error("failed to delete %s: %s", result.item, result.error)
+        return results
 
     # ======================================================================
     # Connections
@@ -186,17 +451,21 @@ class AirbyteHelper:
         return resp.json()
 
     def list_connections(self, workspace_id=None):
-        if workspace_id is None:
-            workspace_id = self.list_workspaces()[0]["workspaceId"]
-        resp = self.launch_request("/v1/connections/list", {"workspaceId": workspace_id})
-        return resp.json()["connections"]
+        return list(self.iter_connections(workspace_id))
+
+    def iter_connections(self, workspace_id=None, page_size=None):
+        return self.iter_resources("connections", workspace_id, page_size)
 
     def list_all_connections(self, workspace_id):
         resp = self.launch_request("/v1/connections/list_all", {"workspaceId": workspace_id})
         return resp.json()
 
+    # Connections including the deleted ones.
+    def iter_all_connections(self, workspace_id, page_size=None):
+        return self.iter_resources("connections", workspace_id, page_size, list_action="list_all")
+
     def get_connection(self, connection_id):
-        resp = self.launch_request("/v1/connections/create", {"connectionId": connection_id})
+        resp = self.launch_request("/v1/connections/get", {"connectionId": connection_id})
         return resp.json()
 
     def trigger_connection_sync(self, connection_id):
@@ -215,6 +484,26 @@ class AirbyteHelper:
         resp = self.launch_request("/v1/connections/reset", {"connectionId": connection_id})
         return resp.json()
 
+    # Bulk variants, e.g. helper.trigger_syncs(connection_ids, max_workers=16, rate_limit=10)
+    def trigger_syncs(self, connection_ids, **bulk_options):
+        return self.run_bulk(self.trigger_connection_sync, connection_ids, **bulk_options)
+
+    def reset_connections(self, connection_ids, **bulk_options):
+        return self.run_bulk(self.reset_connection, connection_ids, **bulk_options)
+
+    def delete_connections(self, connection_ids, **bulk_options):
+        return self.run_bulk(self.delete_connection, connection_ids, **bulk_options)
+
+    # Checks the source and the destination of each connection.
+    def check_connections(self, connection_ids, **bulk_options):
+        def check(connection_id):
+            connection = self.get_connection(connection_id)
+            return {
+                "source": self.check_connection_source(connection["sourceId"]),
+                "destination": self.check_connection_destination(connection["destinationId"]),
+            }
+        return self.run_bulk(check, connection_ids, **bulk_options)
+
     # ======================================================================
     # Connections
     # ======================================================================
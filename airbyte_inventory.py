@@ -0,0 +1,130 @@
+import copy
+import hashlib
+import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+RESOURCE_TYPES = {
+    "destinations": "list_destinations",
+    "sources": "list_sources",
+    "connections": "list_connections",
+}
+ID_KEYS = {
+    "destinations": "destinationId",
+    "sources": "sourceId",
+    "connections": "connectionId",
+}
+
+
+# Remote resources of one type in one env, indexed by id and name.
+class ResourceIndex:
+    def __init__(self, resources, id_key):
+        self.by_id = {}
+        self.by_name = defaultdict(list)
+        for resource in resources:
+            self.by_id[resource[id_key]] = resource
+            self.by_name[resource["name"]].append(resource)
+        self.duplicated_names = {name for name, found in self.by_name.items() if len(found) > 1}
+
+    def find_by_name(self, name):
+        return self.by_name.get(name, [])
+
+    def get(self, resource_id):
+        return self.by_id.get(resource_id)
+
+
+# Remote resources of every environment: inventory.sources["dev"] is the list returned by list_sources() on dev.
+class AirbyteInventory:
+    def __init__(self, destinations, sources, connections):
+        self.destinations = destinations
+        self.sources = sources
+        self.connections = connections
+        self.indexes = {
+            resource_type: {
+                env: ResourceIndex(resources, ID_KEYS[resource_type])
+                for env, resources in getattr(self, resource_type).items()
+            }
+            for resource_type in RESOURCE_TYPES
+        }
+        # Remote id => Terraform path of the resource generated for it, e.g. "airbyte_source_github.my_source".
+        self.tf_paths = {}
+        self.tf_paths_recording = None
+
+    @property
+    def envs(self):
+        return list(self.sources.keys())
+
+    def find_by_name(self, resource_type, name):
+        return {env: index.find_by_name(name) for env, index in self.indexes[resource_type].items()}
+
+    def is_duplicated(self, resource_type, name):
+        return any(name in index.duplicated_names for index in self.indexes[resource_type].values())
+
+    def get(self, resource_type, env, resource_id):
+        return self.indexes[resource_type][env].get(resource_id)
+
+    def fingerprint(self):
+        remote_state = {resource_type: getattr(self, resource_type) for resource_type in RESOURCE_TYPES}
+        return hashlib.sha256(json.dumps(remote_state, sort_keys=True).encode()).hexdigest()
+
+    def set_tf_path(self, resource_type, remote_found, tf_path):
+        for found in remote_found.values():
+            for resource in found:
+                self.tf_paths[resource[ID_KEYS[resource_type]]] = tf_path
+                if self.tf_paths_recording is not None:
+                    self.tf_paths_recording[resource[ID_KEYS[resource_type]]] = tf_path
+
+    # Collects the Terraform paths set in the `with` statement.
+    @contextmanager
+    def record_tf_paths(self):
+        self.tf_paths_recording = {}
+        try:
+            yield self.tf_paths_recording
+        finally:
+            self.tf_paths_recording = None
+
+    def get_tf_path(self, resource_id):
+        return self.tf_paths[resource_id]
+
+    # Same remote resources, with its own Terraform paths: one per data product.
+    def fork(self):
+        inventory = copy.copy(self)
+        inventory.tf_paths = {}
+        inventory.tf_paths_recording = None
+        return inventory
+
+
+def load_inventory(airbyte_helpers, max_workers=8):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Resolved once per env first, so the listings do not all resolve the workspace at the same time:
+        workspace_ids = {env: executor.submit(helper.get_first_workspace_id) for env, helper in airbyte_helpers.items()}
+        futures = {
+            (env, resource_type): executor.submit(getattr(helper, method), workspace_ids[env].result())
+            for env, helper in airbyte_helpers.items()
+            for resource_type, method in RESOURCE_TYPES.items()
+        }
+        return AirbyteInventory(**{
+            resource_type: {env: futures[(env, resource_type)].result() for env in airbyte_helpers}
+            for resource_type in RESOURCE_TYPES
+        })
+
+
+# Same as load_inventory() with AsyncAirbyteHelper: all the listings are requested concurrently.
+async def load_inventory_async(airbyte_helpers):
+    # Imported here: asyncio takes a while to import, and only this function needs it.
+    import asyncio
+
+    envs = list(airbyte_helpers)
+    workspace_ids = await asyncio.gather(*(airbyte_helpers[env].get_first_workspace_id() for env in envs))
+    keys = [(env, resource_type) for env in envs for resource_type in RESOURCE_TYPES]
+    listings = await asyncio.gather(*(
+        getattr(airbyte_helpers[env], method)(workspace_id)
+        for env, workspace_id in zip(envs, workspace_ids)
+        for method in RESOURCE_TYPES.values()
+    ))
+    found = dict(zip(keys, listings))
+    return AirbyteInventory(**{
+        resource_type: {env: found[(env, resource_type)] for env in envs}
+        for resource_type in RESOURCE_TYPES
+    })
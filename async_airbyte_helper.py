@@ -0,0 +1,410 @@
+import asyncio
+import json
+import logging
+import time
+
+import httpx
+
+from airbyte_helper import CACHED_PATHS, MUTATION_RETRY_STATUS_CODES, RETRY_STATUS_CODES, AirbyteApiError, BulkResult
+from tracing import TRACER
+
+logger = logging.getLogger(__name__)
+
+# Transport errors raised before the request was sent: retried on every endpoint, like the connect errors by the
+# Retry of AirbyteHelper. The others (read errors, timeouts...) only on the read only endpoints.
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+# Spaces the calls of all the tasks by 1 / rate seconds at least.
+class AsyncRateLimiter:
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.lock = asyncio.Lock()
+        self.next_call = time.monotonic()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            call_at = max(self.next_call, now)
+            self.next_call = call_at + self.interval
+        if call_at > now:
+            await asyncio.sleep(call_at - now)
+
+
+# Same API as AirbyteHelper, with coroutines: `await helper.list_sources()`.
+# All the calls share one HTTP/2 connection pool, and at most max_concurrency requests are in flight.
+# transport is passed to httpx.AsyncClient, e.g. httpx.MockTransport(handler) to run against a mock API.
+class AsyncAirbyteHelper:
+    def __init__(self, airbyte_base_url, client_id, client_secret, max_concurrency=50, pool_size=10,
+                 connect_timeout=5, read_timeout=60, max_retries=3, backoff_factor=0.5, workspace_cache_ttl=300,
+                 http2=True, transport=None):
+        self.airbyte_base_url = airbyte_base_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.client = httpx.AsyncClient(
+            auth=(client_id, client_secret),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            # HTTP/2 needs the h2 package (httpx[http2] in requirements.txt), and multiplexes the requests on fewer
+            # connections.
+            http2=http2 and transport is None,
+            transport=transport,
+        )
+        self.workspace_cache_ttl = workspace_cache_ttl
+        self.workspace_cache = {}
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def get_cached_workspace(self, key, load):
+        cached = self.workspace_cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        value = await load()
+        self.workspace_cache[key] = (time.monotonic() + self.workspace_cache_ttl, value)
+        return value
+
+    def invalidate_workspace_cache(self):
+        self.workspace_cache.clear()
+
+    # Awaits function(item) for every item, with at most max_workers calls at a time (as AirbyteHelper.run_bulk,
+    # on top of the max_concurrency of the requests) and at most rate_limit calls per second.
+    # Every item is processed whatever the failures: a BulkResult per item is returned, in the order of items.
+    async def run_bulk(self, function, items, max_workers=50, rate_limit=None):
+        rate_limiter = AsyncRateLimiter(rate_limit) if rate_limit else None
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def run(item):
+            async with semaphore:
+                if rate_limiter is not None:
+                    await rate_limiter.wait()
+                try:
+                    return BulkResult(item, result=await function(item))
+                except Exception as e:
+                    return BulkResult(item, error=e)
+
+        return list(await asyncio.gather(*(run(item) for item in items)))
+
+    # Retries 429/5xx and transport errors with exponential backoff (or the Retry-After of the response), like
+    # AirbyteHelper: the mutating endpoints only on a 429/503 with a Retry-After, and on the UNSENT_ERRORS.
+    async def launch_request(self, url_path, data):
+        read_only = url_path in CACHED_PATHS
+        if data is None or len(data.keys()) == 0:
+            headers = {}
+        else:
+            headers = {'Content-type': 'application/json'}
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.semaphore:
+                    with TRACER.span(url_path, "http"):
+                        resp = await self.client.post(
+                            self.airbyte_base_url + "/api" + url_path, content=json.dumps(data), headers=headers
+                        )
+            except httpx.TransportError as e:
+                if attempt == self.max_retries or not (read_only or isinstance(e, UNSENT_ERRORS)):
+                    raise
+                await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+                continue
+            retry_after = resp.headers.get("Retry-After", "")
+            if read_only:
+                retried = resp.status_code in RETRY_STATUS_CODES
+            else:
+                retried = resp.status_code in MUTATION_RETRY_STATUS_CODES and retry_after != ""
+            if not retried or attempt == self.max_retries:
+                break
+            await asyncio.sleep(float(retry_after) if retry_after.isdigit() else self.backoff_factor * 2 ** attempt)
+        if resp.status_code > 299:
+            raise AirbyteApiError(url_path, resp.status_code, resp.content)
+        return resp
+
+    # Pages of page_size items from a list_paginated endpoint, requested one after the other
+    # until a page is not full.
+    async def iter_pages(self, url_path, data, key, page_size):
+        row_offset = 0
+        while True:
+            pagination = {"pageSize": page_size, "rowOffset": row_offset}
+            items = (await self.launch_request(url_path, {**data, "pagination": pagination})).json()[key]
+            for item in items:
+                yield item
+            if len(items) < page_size:
+                return
+            row_offset += page_size
+
+    async def iter_resources(self, resource_type, workspace_id, page_size, list_action="list"):
+        if workspace_id is None:
+            workspace_id = await self.get_first_workspace_id()
+        if page_size is None:
+            resp = await self.launch_request(f"/v1/{resource_type}/{list_action}", {"workspaceId": workspace_id})
+            for item in resp.json()[resource_type]:
+                yield item
+            return
+        async for item in self.iter_pages(
+            f"/v1/{resource_type}/{list_action}_paginated", {"workspaceIds": [workspace_id]}, resource_type, page_size
+        ):
+            yield item
+
+    # ======================================================================
+    # Workspaces
+    # ======================================================================
+    async def create_workspace(self, workspace):
+        resp = await self.launch_request("/v1/workspaces/create", workspace)
+        self.invalidate_workspace_cache()
+        return resp.json()
+
+    async def delete_workspace(self, workspace_id):
+        await self.launch_request("/v1/workspaces/delete", {"workspaceId": workspace_id})
+        self.invalidate_workspace_cache()
+        return True
+
+    async def list_workspaces(self):
+        async def load():
+            return (await self.launch_request("/v1/workspaces/list", {})).json()["workspaces"]
+        return await self.get_cached_workspace(("list",), load)
+
+    async def get_workspace(self, workspace_id):
+        resp = await self.launch_request("/v1/workspaces/get", {"workspaceId": workspace_id})
+        return resp.json()
+
+    async def get_workspace_by_slug(self, slug):
+        async def load():
+            return (await self.launch_request("/v1/workspaces/get_by_slug", {"slug": slug})).json()
+        return await self.get_cached_workspace(("slug", slug), load)
+
+    async def get_first_workspace_id(self):
+        return (await self.list_workspaces())[0]["workspaceId"]
+
+    async def get_workspace_by_connection_id(self, connection_id):
+        async def load():
+            return (await self.launch_request(
+                "/v1/workspaces/get_by_connection_id", {"connectionId": connection_id}
+            )).json()
+        return await self.get_cached_workspace(("connection", connection_id), load)
+
+    async def update_workspace(self, workspace):
+        resp = await self.launch_request("/v1/workspaces/update", workspace)
+        self.invalidate_workspace_cache()
+        return resp.json()
+
+    async def update_workspace_name(self, workspace_id, new_name):
+        resp = await self.launch_request("/v1/workspaces/update", {
+            "workspaceId": workspace_id,
+            "name": new_name
+        })
+        self.invalidate_workspace_cache()
+        return resp.json()
+
+    async def update_workspace_tag_feedback_status_as_done(self, workspace_id):
+        resp = await self.launch_request("/v1/workspaces/tag_feedback_status_as_done", {"workspaceId": workspace_id})
+        self.invalidate_workspace_cache()
+        return resp.json()
+
+    # ======================================================================
+    # Sources
+    # ======================================================================
+    async def create_sources(self, source):
+        resp = await self.launch_request("/v1/sources/create", source)
+        return resp.json()
+
+    async def update_source(self, source):
+        resp = await self.launch_request("/v1/sources/update", source)
+        return resp.json()
+
+    async def list_sources(self, workspace_id=None):
+        return [source async for source in self.iter_sources(workspace_id)]
+
+    def iter_sources(self, workspace_id=None, page_size=None):
+        return self.iter_resources("sources", workspace_id, page_size)
+
+    async def get_source(self, source_id):
+        resp = await self.launch_request("/v1/sources/get", {"sourceId": source_id})
+        return resp.json()
+
+    async def get_source_most_recent_source_actor_catalog(self, source_id):
+        resp = await self.launch_request("/v1/sources/get_most_recent_source_actor_catalog", {"sourceId": source_id})
+        return resp.json()
+
+    async def search_source(self, search_source_body):
+        resp = await self.launch_request("/v1/sources/search", search_source_body)
+        return resp.json()
+
+    async def clone_source(self, clone_source_body):
+        resp = await self.launch_request("/v1/sources/clone", clone_source_body)
+        return resp.json()
+
+    async def delete_source(self, source_id):
+        resp = await self.launch_request("/v1/sources/delete", {"sourceId": source_id})
+        return resp.json()
+
+    async def check_connection_source(self, source_id):
+        resp = await self.launch_request("/v1/sources/check_connection", {"sourceId": source_id})
+        return resp.json()
+
+    async def check_connection_for_update_source(self, check_connection_for_update_body):
+        resp = await self.launch_request("/v1/sources/check_connection_for_update", check_connection_for_update_body)
+        return resp.json()
+
+    async def discover_schema_source(self, source_id, connection_id, disable_cache, notify_schema_change):
+        resp = await self.launch_request("/v1/sources/check_connection_for_update", {
+            "sourceId": source_id,
+            "connectionId": connection_id,
+            "disable_cache": disable_cache,
+            "notifySchemaChange": notify_schema_change
+        })
+        return resp.json()
+
+    async def write_discover_catalog_result_source(self, write_discover_catalog_result_body):
+        resp = await self.launch_request(
+            "/v1/sources/write_discover_catalog_result", write_discover_catalog_result_body
+        )
+        return resp.json()
+
+    async def delete_sources(self, source_ids, **bulk_options):
+        return await self.run_bulk(self.delete_source, source_ids, **bulk_options)
+
+    async def check_connection_sources(self, source_ids, **bulk_options):
+        return await self.run_bulk(self.check_connection_source, source_ids, **bulk_options)
+
+    # ======================================================================
+    # Destinations
+    # ======================================================================
+
+    async def create_destinations(self, destination):
+        resp = await self.launch_request("/v1/destination_definitions/create", destination)
+        return resp.json()
+
+    async def update_destinations(self, destination):
+        resp = await self.launch_request("/v1/destination_definitions/update", destination)
+        return resp.json()
+
+    async def list_destinations(self, workspace_id=None):
+        return [destination async for destination in self.iter_destinations(workspace_id)]
+
+    def iter_destinations(self, workspace_id=None, page_size=None):
+        return self.iter_resources("destinations", workspace_id, page_size)
+
+    async def get_destination(self, destination_id):
+        resp = await self.launch_request("/v1/destinations/get", {"destinationId": destination_id})
+        return resp.json()
+
+    async def delete_destination(self, destination_id):
+        await self.launch_request("/v1/destinations/delete", {"destinationId": destination_id})
+        return True
+
+    async def search_destination(self, search_destination_body):
+        resp = await self.launch_request("/v1/destinations/search", search_destination_body)
+        return resp.json()
+
+    async def check_connection_destination(self, destination_id):
+        resp = await self.launch_request("/v1/destinations/check_connection", {"destinationId": destination_id})
+        return resp.json()
+
+    async def check_connection_for_update_destination(self, check_connection_for_update_body):
+        resp = await self.launch_request(
+            "/v1/destinations/check_connection_for_update", check_connection_for_update_body
+        )
+        return resp.json()
+
+    async def clone_destination(self, clone_body):
+        resp = await self.launch_request("/v1/destinations/clone", clone_body)
+        return resp.json()
+
+    async def delete_destinations(self, destination_ids, **bulk_options):
+        return await self.run_bulk(self.delete_destination, destination_ids, **bulk_options)
+
+    async def check_connection_destinations(self, destination_ids, **bulk_options):
+        return await self.run_bulk(self.check_connection_destination, destination_ids, **bulk_options)
+
+    async def delete_all_destinations(self, workspace_id=None, **bulk_options):
+        if workspace_id is None:
+            workspace_id = await self.get_first_workspace_id()
+        logger.info("Workspace ID %s", workspace_id)
+        destination_ids = [destination["destinationId"] for destination in await self.list_destinations(workspace_id)]
+        results = await self.delete_destinations(destination_ids, **bulk_options)
+        for result in results:
+            if result.ok:
+                logger.info("deleted %s", result.item)
+            else:
+                logger.error("failed to delete %s: %s", result.item, result.error)
+        return results
+
+    # ======================================================================
+    # Connections
+    # ======================================================================
+
+    async def create_connection(self, connection):
+        resp = await self.launch_request("/v1/connections/create", connection)
+        return resp.json()
+
+    async def update_connection(self, connection):
+        resp = await self.launch_request("/v1/connections/update", connection)
+        return resp.json()
+
+    async def list_connections(self, workspace_id=None):
+        return [connection async for connection in self.iter_connections(workspace_id)]
+
+    def iter_connections(self, workspace_id=None, page_size=None):
+        return self.iter_resources("connections", workspace_id, page_size)
+
+    async def list_all_connections(self, workspace_id):
+        resp = await self.launch_request("/v1/connections/list_all", {"workspaceId": workspace_id})
+        return resp.json()
+
+    # Connections including the deleted ones.
+    def iter_all_connections(self, workspace_id, page_size=None):
+        return self.iter_resources("connections", workspace_id, page_size, list_action="list_all")
+
+    async def get_connection(self, connection_id):
+        resp = await self.launch_request("/v1/connections/get", {"connectionId": connection_id})
+        return resp.json()
+
+    async def trigger_connection_sync(self, connection_id):
+        resp = await self.launch_request("/v1/connections/sync", {"connectionId": connection_id})
+        return resp.json()
+
+    async def delete_connection(self, connection_id):
+        await self.launch_request("/v1/connections/delete", {"connectionId": connection_id})
+        return True
+
+    async def search_connections(self, search_connection_body):
+        resp = await self.launch_request("/v1/connections/search", search_connection_body)
+        return resp.json()
+
+    async def reset_connection(self, connection_id):
+        resp = await self.launch_request("/v1/connections/reset", {"connectionId": connection_id})
+        return resp.json()
+
+    async def trigger_syncs(self, connection_ids, **bulk_options):
+        return await self.run_bulk(self.trigger_connection_sync, connection_ids, **bulk_options)
+
+    async def reset_connections(self, connection_ids, **bulk_options):
+        return await self.run_bulk(self.reset_connection, connection_ids, **bulk_options)
+
+    async def delete_connections(self, connection_ids, **bulk_options):
+        return await self.run_bulk(self.delete_connection, connection_ids, **bulk_options)
+
+    # Checks the source and the destination of each connection.
+    async def check_connections(self, connection_ids, **bulk_options):
+        async def check(connection_id):
+            connection = await self.get_connection(connection_id)
+            source, destination = await asyncio.gather(
+                self.check_connection_source(connection["sourceId"]),
+                self.check_connection_destination(connection["destinationId"]),
+            )
+            return {"source": source, "destination": destination}
+        return await self.run_bulk(check, connection_ids, **bulk_options)
+
+    # ======================================================================
+    # Logs
+    # ======================================================================
+    async def get_logs(self):
+        resp = await self.launch_request("/v1/logs/get", {"logType": "server"})
+        return resp.text
@@ -0,0 +1,49 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from generate_tf import Migrator
+from tracing import instrumented_from_env
+
+OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "output")
+
+
+def migrate_data_product(migrator, dp_name, yaml_executor):
+    return migrator.data_product(dp_name, f"{OUTPUT_DIR}/{dp_name}", yaml_executor).run()
+
+
+# Migrates all the data products in one process: the Airbyte inventory and the clients are loaded once,
+# and each data product gets its own main.tf in OUTPUT_DIR/<data product>/.
+def migrate_all(migrator, dp_names, max_workers=4):
+    report = {}
+    migrator.load_inventory()
+    with ProcessPoolExecutor() as yaml_executor:
+        # The YAML workers are started before the conversion threads, not forked from them:
+        yaml_executor.submit(os.getpid).result()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                dp_name: executor.submit(migrate_data_product, migrator, dp_name, yaml_executor)
+                for dp_name in dict.fromkeys(dp_names)
+            }
+            for dp_name, future in futures.items():
+                try:
+                    report[dp_name] = (True, future.result())
+                except Exception as e:
+                    report[dp_name] = (False, f"{type(e).__name__}: {e}")
+    return report
+
+
+def print_report(report):
+    for dp_name, (success, message) in report.items():
+        print(f"{'OK    ' if success else 'FAILED'} {dp_name}: {message}")
+    failures = sum(1 for success, _ in report.values() if not success)
+    print(f"{len(report) - failures} data products migrated, {failures} failed")
+
+
+if __name__ == "__main__":
+    # Data products given as arguments, or as a comma separated DP_NAMES
+    dp_names = sys.argv[1:] or os.environ["DP_NAMES"].split(",")
+    with instrumented_from_env():
+        report = migrate_all(Migrator.from_env(), dp_names, max_workers=int(os.environ.get("MAX_WORKERS", 4)))
+    print_report(report)
+    sys.exit(1 if any(not success for success, _ in report.values()) else 0)
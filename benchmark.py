@@ -0,0 +1,340 @@
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import yaml
+
+from generate_tf import DataProductMigration, Migrator
+
+# Usage:
+#   BENCH_CONNECTIONS=10,100,1000 python benchmark.py              # compared to the stored baseline
+#   BENCH_CONNECTIONS=10,100,1000 BENCH_SAVE_BASELINE=1 python benchmark.py
+# Other settings: BENCH_STREAMS (streams per connection), BENCH_CONNECTIONS_PER_SOURCE, BENCH_LATENCY (seconds added
+# by the fake Airbyte API to every call), BENCH_BASELINE (file of the baseline), BENCH_TOLERANCE (0.25: +25%),
+# BENCH_MEMORY=0 to skip the second run measuring the memory.
+DP_NAME = "bench"
+ENVS = ["dev", "prod"]
+IMAGES = ["airbyte/source-postgres", "airbyte/source-github", "airbyte/source-declarative-manifest"]
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+# Differences smaller than this are noise, whatever the tolerance:
+MIN_SECONDS = 0.05
+MIN_PEAK_MB = 1
+MASKED_SECRET = "**********"
+
+
+# Stream of an Octavia sync_catalog => stream of the syncCatalog returned by the API (without the jsonSchema).
+def live_stream(stream):
+    return {
+        "stream": {
+            "name": stream["stream"]["name"],
+            "supportedSyncModes": stream["stream"]["supported_sync_modes"],
+            "defaultCursorField": stream["stream"]["default_cursor_field"],
+            "sourceDefinedPrimaryKey": stream["stream"]["source_defined_primary_key"],
+        },
+        "config": {
+            "syncMode": stream["config"]["sync_mode"],
+            "destinationSyncMode": stream["config"]["destination_sync_mode"],
+            "primaryKey": stream["config"]["primary_key"],
+            "cursorField": stream["config"]["cursor_field"],
+            "selected": stream["config"]["selected"],
+            "aliasName": stream["config"]["alias_name"],
+        },
+    }
+
+
+# Writes an Octavia tree of n_connections connections of n_streams streams in folder/airbyte,
+# and returns the remote resources matching it, e.g. resources["sources"]["dev"]: in sync with the tree,
+# configurations (secrets masked) and catalogs included, as returned by the API.
+def make_data_product(folder, n_connections, n_streams=10, connections_per_source=1, seed=0):
+    rnd = random.Random(seed)
+    resources = {
+        resource_type: {env: [] for env in ENVS} for resource_type in ["destinations", "sources", "connections"]
+    }
+    for env in ENVS:
+        resources["destinations"][env].append({"destinationId": f"{env}-destination", "name": "BigQuery"})
+
+    def write(path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            yaml.dump(content, file, Dumper=YamlDumper, sort_keys=False)
+
+    n_sources = -(-n_connections // connections_per_source)
+    for i in range(n_sources):
+        configuration = {
+            "host": f"db-{i}.example.com",
+            "port": 5432,
+            "password": f"${{DB_PASSWORD_{i}}}",
+            "schemas": ["public", f"schema_{rnd.randrange(100)}"],
+            "replication_method": {"method": "Standard"},
+            "credentials": {"option_title": "OAuth Credentials"} if i % len(IMAGES) == 1 else {"api_key": "key"},
+        }
+        write(f"{folder}/airbyte/sources/source_{i}/configuration.yaml", {
+            "resource_name": f"Source {i}",
+            "definition_type": "source",
+            "definition_id": f"definition-{i % len(IMAGES)}",
+            "definition_image": IMAGES[i % len(IMAGES)],
+            "definition_version": "1.0.0",
+            "configuration": configuration,
+        })
+        for env in ENVS:
+            resources["sources"][env].append({
+                "sourceId": f"{env}-source-{i}",
+                "name": f"Source {i}",
+                "connectionConfiguration": {**configuration, "password": MASKED_SECRET},
+            })
+
+    for j in range(n_connections):
+        i = j // connections_per_source
+        streams = []
+        for k in range(n_streams):
+            incremental = rnd.random() < 0.5
+            cursor_field = ["updated_at"] if incremental else []
+            streams.append({
+                "stream": {
+                    "name": f"stream_{k}",
+                    "json_schema": {
+                        "type": "object",
+                        "properties": {
+                            f"column_{c}": {"type": ["null", "string"]} for c in range(rnd.randrange(5, 30))
+                        },
+                    },
+                    "supported_sync_modes": ["full_refresh", "incremental"],
+                    "default_cursor_field": cursor_field,
+                    "source_defined_primary_key": [],
+                },
+                "config": {
+                    "sync_mode": "incremental" if incremental else "full_refresh",
+                    "destination_sync_mode": "append_dedup" if incremental else "overwrite",
+                    "primary_key": [["id"]] if incremental else [],
+                    "cursor_field": cursor_field,
+                    # The last stream of every other connection is not synced:
+                    "selected": k < n_streams - 1 or j % 2 == 0,
+                    "alias_name": f"stream_{k}",
+                },
+            })
+        write(f"{folder}/airbyte/connections/connection_{j}/configuration.yaml", {
+            "resource_name": f"Connection {j}",
+            "definition_type": "connection",
+            "source_configuration_path": f"sources/source_{i}/configuration.yaml",
+            "destination_configuration_path": "destinations/bigquery/configuration.yaml",
+            "configuration": {
+                "status": "active",
+                "namespace_definition": "customformat",
+                "sync_catalog": {"streams": streams},
+            },
+        })
+        for env in ENVS:
+            resources["connections"][env].append({
+                "connectionId": f"{env}-connection-{j}",
+                "name": f"Connection {j}",
+                "sourceId": f"{env}-source-{i}",
+                "namespaceDefinition": "customformat",
+                "namespaceFormat": "${SOURCE_NAMESPACE}",
+                "nonBreakingChangesPreference": "ignore",
+                "status": "active",
+                "scheduleType": "cron",
+                "scheduleData": {"cron": {"cronExpression": "0 0 * * * ?"}},
+                "syncCatalog": {"streams": [live_stream(stream) for stream in streams]},
+            })
+    return resources
+
+
+# Stand-in for the /api/v1/... endpoints of an Airbyte server, served from resources (of one env)
+# on a local port, latency seconds after each request.
+class FakeAirbyteApi:
+    ID_KEYS = {"sources": "sourceId", "destinations": "destinationId", "connections": "connectionId"}
+
+    def __init__(self, resources, latency=0.0):
+        self.resources = resources
+        self.latency = latency
+        self.requests = 0
+        self.server = None
+
+    def handle(self, url_path, body):
+        self.requests += 1
+        _, _, resource_type, action = url_path.split("/", 4)[1:]
+        if resource_type == "workspaces":
+            return {"workspaces": [{"workspaceId": "workspace", "slug": "workspace"}]}
+        if action in ("list", "list_all"):
+            return {resource_type: self.resources.get(resource_type, [])}
+        if action == "get":
+            id_key = self.ID_KEYS[resource_type]
+            return next(resource for resource in self.resources[resource_type] if resource[id_key] == body[id_key])
+        if action == "sync":
+            return {"job": {"id": self.requests, "status": "running"}}
+        return {}
+
+    def start(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body in one packet, not delayed by Nagle's algorithm:
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(api.latency)
+                try:
+                    status, response = 200, api.handle(self.path, json.loads(body or b"{}") or {})
+                except Exception as e:
+                    status, response = 404, {"message": str(e)}
+                content = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+# Wall time of each stage, or with trace_memory the peak of memory allocated in it (tracemalloc):
+# tracing slows everything down, so both are not measured in the same run.
+# The memory of the YAML parsing worker processes is not included.
+class StageTimer:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        yield
+        if self.trace_memory:
+            self.stages[name] = {"peak_mb": round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)}
+            tracemalloc.stop()
+        else:
+            self.stages[name] = {"seconds": round(time.perf_counter() - start, 4)}
+
+
+def run_scenario(n_connections, n_streams=10, connections_per_source=1, latency=0.0, trace_memory=False):
+    from airbyte_helper import AirbyteHelper
+
+    timer = StageTimer(trace_memory)
+    with tempfile.TemporaryDirectory() as workdir:
+        migrator = Migrator("bench", cache_dir=f"{workdir}/data_product_cache")
+        folder = f"{migrator.cache_dir}/{migrator.get_repo(DP_NAME).split('/')[-1]}"
+        resources = make_data_product(folder, n_connections, n_streams, connections_per_source)
+        env_resources = {
+            env: {resource_type: found[env] for resource_type, found in resources.items()} for env in ENVS
+        }
+        migrator.gh_secrets = {migrator.get_repo(DP_NAME): [
+            "DEV_AIRBYTE_CLIENT_ID", "DEV_AIRBYTE_CLIENT_SECRET", "DEV_ACCESS_TOKEN"
+        ] + [f"DEV_DB_PASSWORD_{i}" for i in range(n_connections)]}
+
+        with FakeAirbyteApi(env_resources["dev"], latency) as dev_url, \
+                FakeAirbyteApi(env_resources["prod"], latency) as prod_url:
+            migrator.airbyte_helpers = {"dev": AirbyteHelper(dev_url, "id", "secret"),
+                                        "prod": AirbyteHelper(prod_url, "id", "secret")}
+            with timer.stage("inventory"):
+                migrator.load_inventory()
+            with timer.stage("trigger_syncs"):
+                results = migrator.airbyte_helpers["dev"].trigger_syncs(
+                    [connection["connectionId"] for connection in resources["connections"]["dev"]]
+                )
+            if not all(result.ok for result in results):
+                raise Exception(f"trigger_syncs failed: {[result for result in results if not result.ok][:3]}")
+
+        output_folder = f"{workdir}/output"
+        with timer.stage("convert"):
+            migration = DataProductMigration(migrator, DP_NAME, output_folder)
+            migration.convert()
+        with timer.stage("render"):
+            migration.render()
+        with timer.stage("convert_cached"):
+            DataProductMigration(migrator, DP_NAME, output_folder).run()
+        timer.stages["output"] = {"bytes": os.path.getsize(f"{output_folder}/main.tf")}
+    return timer.stages
+
+
+# Stages slower or bigger than the baseline by more than tolerance (a ratio), as messages.
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for scenario, stages in results.items():
+        for stage, measures in stages.items():
+            base = baseline.get(scenario, {}).get(stage)
+            if base is None:
+                continue
+            for measure, minimum in [("seconds", MIN_SECONDS), ("peak_mb", MIN_PEAK_MB)]:
+                if measure not in base or measure not in measures:
+                    continue
+                if measures[measure] > base[measure] * (1 + tolerance) and measures[measure] - base[measure] > minimum:
+                    regressions.append(
+                        f"{scenario} {stage}: {measure} {measures[measure]} > {base[measure]} (baseline)"
+                    )
+    return regressions
+
+
+def print_results(results, baseline):
+    print(f"{'scenario':<14} {'stage':<16} {'seconds':>10} {'baseline':>10} {'peak MB':>10} {'baseline':>10}")
+    for scenario, stages in results.items():
+        for stage, measures in stages.items():
+            if "bytes" in measures:
+                continue
+            base = baseline.get(scenario, {}).get(stage, {})
+            print(
+                f"{scenario:<14} {stage:<16} {measures['seconds']:>10.3f} {base.get('seconds', ''):>10} "
+                f"{measures.get('peak_mb', ''):>10} {base.get('peak_mb', ''):>10}"
+            )
+
+
+if __name__ == "__main__":
+    n_streams = int(os.environ.get("BENCH_STREAMS", "10"))
+    connections_per_source = int(os.environ.get("BENCH_CONNECTIONS_PER_SOURCE", "1"))
+    latency = float(os.environ.get("BENCH_LATENCY", "0.002"))
+    baseline_path = os.environ.get("BENCH_BASELINE", "benchmark_baseline.json")
+    tolerance = float(os.environ.get("BENCH_TOLERANCE", "0.25"))
+    trace_memory = os.environ.get("BENCH_MEMORY", "1") != "0"
+
+    results = {}
+    for n_connections in [int(n) for n in os.environ.get("BENCH_CONNECTIONS", "10,100,1000").split(",")]:
+        scenario = f"{n_connections}x{n_streams}"
+        print(f"Running {scenario}: {n_connections} connections of {n_streams} streams...", file=sys.stderr)
+        results[scenario] = run_scenario(n_connections, n_streams, connections_per_source, latency)
+        if trace_memory:
+            memory = run_scenario(n_connections, n_streams, connections_per_source, latency, trace_memory=True)
+            for stage, measures in memory.items():
+                results[scenario][stage].update(measures)
+
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    if os.environ.get("BENCH_SAVE_BASELINE"):
+        with open(baseline_path, "w", encoding="utf-8") as file:
+            json.dump({**baseline, **results}, file, indent=2)
+        print(f"Baseline saved to {baseline_path}")
+    else:
+        regressions = find_regressions(results, baseline, tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
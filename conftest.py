@@ -0,0 +1,53 @@
+import pytest
+
+from airbyte_helper import AirbyteHelper
+from benchmark import DP_NAME, ENVS, FakeAirbyteApi, make_data_product
+from generate_tf import Migrator
+
+
+# Data product generated by benchmark.py (sources 0 to n_connections - 1, a connection per source), with fake
+# Airbyte APIs serving its remote resources: data_product.resources["sources"]["prod"]...
+class FakeDataProduct:
+    def __init__(self, tmp_path, n_connections):
+        self.cache_dir = f"{tmp_path}/data_product_cache"
+        self.output_folder = f"{tmp_path}/output"
+        # env => URL of its fake API, once started:
+        self.urls = {}
+        self.folder = f"{self.cache_dir}/{Migrator('bench').get_repo(DP_NAME).split('/')[-1]}"
+        self.resources = make_data_product(self.folder, n_connections, 3)
+        self.secrets = ["DEV_AIRBYTE_CLIENT_ID", "DEV_AIRBYTE_CLIENT_SECRET", "DEV_ACCESS_TOKEN"] + [
+            f"DEV_DB_PASSWORD_{i}" for i in range(n_connections)
+        ]
+
+    def configuration_path(self, resource_type, index):
+        return f"{self.folder}/airbyte/{resource_type}/{resource_type[:-1]}_{index}/configuration.yaml"
+
+    def edit(self, resource_type, index, old, new):
+        path = self.configuration_path(resource_type, index)
+        with open(path) as file:
+            text = file.read()
+        assert old in text
+        with open(path, "w") as file:
+            file.write(text.replace(old, new))
+
+    # A new Migrator, as in another run of generate_tf.py.
+    def migration(self, **options):
+        migrator = Migrator("bench", cache_dir=self.cache_dir, **options)
+        migrator.gh_secrets = {migrator.get_repo(DP_NAME): self.secrets}
+        migrator.airbyte_helpers = {env: AirbyteHelper(url, "id", "secret") for env, url in self.urls.items()}
+        return migrator.data_product(DP_NAME, self.output_folder)
+
+
+@pytest.fixture
+def data_product(tmp_path):
+    found = FakeDataProduct(tmp_path, 4)
+    servers = {
+        env: FakeAirbyteApi({resource_type: by_env[env] for resource_type, by_env in found.resources.items()})
+        for env in ENVS
+    }
+    found.urls = {env: server.start() for env, server in servers.items()}
+    try:
+        yield found
+    finally:
+        for server in servers.values():
+            server.stop()
@@ -0,0 +1,102 @@
+import re
+
+from hcl_writer import CommentedOut, Expression, template
+
+# What the conversion changes from the Octavia files and the Airbyte API to the Terraform provider.
+# The rules apply to the values before they are rendered, never to the rendered HCL.
+CONVERSION_RULES = {
+    # definition_image => Terraform resource type. The others: "/" and "-" replaced by "_".
+    "resource_types": {
+        "airbyte/source-declarative-manifest": "airbyte_source_custom",
+    },
+    "resource_type_separators": r"[/-]",
+    # sync_mode, destination_sync_mode => sync_mode of the provider. The others: joined by "_".
+    "sync_modes": {
+        ("incremental", "append_dedup"): "incremental_deduped_history",
+    },
+    "namespace_definitions": {
+        "customformat": "custom_format",
+    },
+    # Due to a bug in Airbyte, https://github.com/airbytehq/terraform-provider-airbyte/issues/88
+    # these attributes of the sources are written commented out:
+    "commented_attributes": ["definition_id"],
+    # ${NAME} in the Octavia files => var.NAME. The rest of the strings is literal text.
+    "secret": r"\$\{(?:var\.)?([A-Za-z_][A-Za-z0-9_]*)}",
+    # In the data products with "_github_" in their name, the OAuth credentials of the sources are replaced
+    # by a personal access token.
+    "github": {
+        "dp_name_marker": "_github_",
+        "option_title": "OAuth Credentials",
+        "credentials": {"personal_access_token": {"personal_access_token": Expression("var.ACCESS_TOKEN")}},
+    },
+}
+
+
+# CONVERSION_RULES compiled once. The results depending on a few distinct values (definition images,
+# sync mode pairs) are cached, so converting a resource costs a few dict lookups.
+class ConversionRules:
+    def __init__(self, rules=CONVERSION_RULES):
+        self.resource_types = dict(rules["resource_types"])
+        self.resource_type_separators = re.compile(rules["resource_type_separators"])
+        self.sync_modes = dict(rules["sync_modes"])
+        self.namespace_definitions = dict(rules["namespace_definitions"])
+        self.commented_attributes = list(rules["commented_attributes"])
+        self.secret = re.compile(rules["secret"])
+        self.github = rules["github"]
+
+    def resource_type(self, definition_image):
+        found = self.resource_types.get(definition_image)
+        if found is None:
+            found = self.resource_type_separators.sub("_", definition_image)
+            self.resource_types[definition_image] = found
+        return found
+
+    def sync_mode(self, sync_mode, destination_sync_mode):
+        key = (sync_mode, destination_sync_mode)
+        found = self.sync_modes.get(key)
+        if found is None:
+            found = f"{sync_mode}_{destination_sync_mode}"
+            self.sync_modes[key] = found
+        return found
+
+    def namespace_definition(self, namespace_definition):
+        return self.namespace_definitions.get(namespace_definition, namespace_definition)
+
+    def add_var_to_secrets(self, value):
+        if isinstance(value, dict):
+            return {key: self.add_var_to_secrets(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.add_var_to_secrets(item) for item in value]
+        if isinstance(value, str) and "${" in value:
+            secret = self.secret.fullmatch(value)
+            if secret:
+                return Expression(f"var.{secret.group(1)}")
+            parts = []
+            position = 0
+            for secret in self.secret.finditer(value):
+                parts.extend([value[position:secret.start()], Expression(f"var.{secret.group(1)}")])
+                position = secret.end()
+            if position == 0:
+                return value
+            parts.append(value[position:])
+            return template(parts)
+        return value
+
+    def fixes_github(self, dp_name):
+        return self.github["dp_name_marker"] in dp_name
+
+    # Source resource (attributes of the Octavia file, without the definition_*), changed in place.
+    def convert_source(self, content, fix_github=False):
+        for attribute in self.commented_attributes:
+            if attribute in content:
+                content[attribute] = CommentedOut(content[attribute])
+        configuration = self.add_var_to_secrets(content["configuration"])
+        credentials = configuration.get("credentials")
+        if fix_github and isinstance(credentials, dict) and \
+                credentials.get("option_title") == self.github["option_title"]:
+            configuration["credentials"] = self.github["credentials"]
+        content["configuration"] = configuration
+        return content
+
+
+RULES = ConversionRules()
@@ -0,0 +1,121 @@
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from airbyte_helper import BulkResult
+from generate_tf import Migrator, connection_to_tf
+from octavia_reader import StreamRecord
+from resource_model import model_hash, model_paths
+from tracing import TRACER, instrumented_from_env
+
+logger = logging.getLogger(__name__)
+
+LIVE_GETTERS = {
+    "sources": "get_source",
+    "destinations": "get_destination",
+    "connections": "get_connection",
+}
+# Value of the secrets in the responses of the API: never compared.
+MASKED_SECRET = "**********"
+
+
+# Streams of the syncCatalog of a live connection, read like the ones of the Octavia files. The streams not
+# selected are kept, as the conversion keeps the ones of the Octavia files.
+def live_streams(connection):
+    return [
+        StreamRecord(
+            stream["stream"]["name"],
+            stream["config"]["syncMode"],
+            stream["config"]["destinationSyncMode"],
+            stream["stream"].get("defaultCursorField") or [],
+            stream["config"].get("primaryKey") or [],
+        )
+        for stream in connection.get("syncCatalog", {}).get("streams", [])
+    ]
+
+
+# Live resource => same form as the model recorded by DataProductMigration.add_model().
+def live_model(resource_type, resource):
+    if resource_type == "sources":
+        return {"name": resource["name"], "configuration": resource.get("connectionConfiguration", {})}
+    if resource_type == "connections":
+        return connection_to_tf(resource, live_streams(resource), resource["sourceId"])
+    return {"name": resource["name"]}
+
+
+# Differences between the expected paths and the live ones, [] when the hashes match.
+# Only the expected paths are compared: the API returns the defaults of everything that was not set.
+def diff_model(model, live_paths):
+    comparable = {}
+    for path, expected in model["paths"].items():
+        if path not in live_paths:
+            continue
+        comparable[path] = expected if live_paths[path] == MASKED_SECRET else live_paths[path]
+    if len(comparable) == len(model["paths"]) and model_hash(comparable) == model["hash"]:
+        return []
+    return [
+        (path, expected, comparable.get(path, "<missing>"))
+        for path, expected in model["paths"].items()
+        if comparable.get(path, "<missing>") != expected
+    ]
+
+
+# Fetches the live state of every imported resource, in both envs at once, and diffs it with the models
+# of the migration. Returns {tf_path: {env: [(path, expected, live)...] or the error}}, drifted resources only.
+def check_drift(models, airbyte_helpers, max_workers=16):
+    def fetch(item):
+        tf_path, env = item
+        model = models[tf_path]
+        resource_type = model["resource_type"]
+        getter = getattr(airbyte_helpers[env], LIVE_GETTERS[resource_type])
+        try:
+            with TRACER.span(tf_path, "file", env=env):
+                live = live_model(resource_type, getter(model["remote_ids"][env]))
+            return BulkResult(item, result=diff_model(model, model_paths(live)))
+        except Exception as e:
+            return BulkResult(item, error=e)
+
+    items = [(tf_path, env) for tf_path, model in models.items() for env in model["remote_ids"]]
+    if len(items) == 0:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        results = list(executor.map(fetch, items))
+
+    drift = {}
+    for result in results:
+        tf_path, env = result.item
+        if not result.ok:
+            drift.setdefault(tf_path, {})[env] = f"{type(result.error).__name__}: {result.error}"
+        elif result.result:
+            drift.setdefault(tf_path, {})[env] = result.result
+    return drift
+
+
+def print_drift(models, drift):
+    for tf_path, model in models.items():
+        if tf_path not in drift:
+            print(f"OK    {model['resource_type']} {tf_path}")
+            continue
+        print(f"DRIFT {model['resource_type']} {tf_path}")
+        for env, differences in drift[tf_path].items():
+            if isinstance(differences, str):
+                print(f"      [{env}] {differences}")
+                continue
+            for path, expected, live in differences:
+                print(f"      [{env}] {path}: expected {expected!r}, live {live!r}")
+    print(f"{len(models) - len(drift)} resources in sync, {len(drift)} drifted")
+
+
+# Usage: DP_NAME=... python drift_check.py (same settings as generate_tf.py, not in SNAPSHOT mode)
+# Generates the Terraform files of the data product, then compares them with the live Airbyte resources.
+if __name__ == "__main__":
+    with instrumented_from_env():
+        migrator = Migrator.from_env()
+        migration = migrator.data_product(os.environ["DP_NAME"])
+        migration.run()
+        with TRACER.span("drift", dp_name=migration.dp_name):
+            drift = check_drift(migration.models, migrator.airbyte_helpers,
+                                max_workers=int(os.environ.get("MAX_WORKERS", 16)))
+    print_drift(migration.models, drift)
+    sys.exit(1 if drift else 0)
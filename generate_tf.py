@@ -1,63 +1,274 @@
-import json
+import logging
 import os
-import re
-
-import httpx
-import yaml
-from git.repo.base import Repo
-import shutil
+from contextlib import contextmanager
 from pathlib import Path
 
-from airbyte_helper import AirbyteHelper
+from airbyte_inventory import ID_KEYS, load_inventory
+from conversion_rules import RULES
+from git_checkout import sync_checkout
+from hcl_check import HclChecker
+from hcl_writer import Expression
+from octavia_reader import find_configurations, read_configurations
+from resource_model import model_hash, model_paths
+from snapshot import load_snapshot
+from tf_cache import ConversionCache, code_fingerprint, file_hash, fingerprint
+from tf_document import (
+    TfDocument, SplitTfDocument, TfBlock, ProviderBlock, VariableBlock, ImportBlock, ResourceBlock
+)
+from tracing import TRACER, instrumented_from_env
+
+logger = logging.getLogger(__name__)
 
-OUTPUT = ""
 PROD_ENV = "prod"
-DP_NAME = os.environ["DP_NAME"]
-# DP_NAME = "glb-degreed-learning"
-GIT_ORGANIZATION = os.environ["GIT_ORGANIZATION"]
-
-repo = f"{GIT_ORGANIZATION}/data-product-{DP_NAME.replace('-', '_')}"
-FOLDER = "data_product"
-airbyte_helpers = {
-    "dev": AirbyteHelper(
-        os.environ["DEV_AIRBYTE_URL"], os.environ["DEV_AIRBYTE_CLIENT_ID"], os.environ["DEV_AIRBYTE_CLIENT_SECRET"]
-    ),
-    "prod": AirbyteHelper(
-        os.environ["PROD_AIRBYTE_URL"], os.environ["PROD_AIRBYTE_CLIENT_ID"], os.environ["PROD_AIRBYTE_CLIENT_SECRET"]
-    )
-}
-all_envs = airbyte_helpers.keys()
-sources = {}
-connections = {}
-destinations = {}
 
-for env_value in all_envs:
-    destinations[env_value] = airbyte_helpers[env_value].list_destinations()
-    if len(destinations[env_value]) > 1 and "sp_lm" in DP_NAME:
-        raise Exception("We made the script working for only one destination. Is it possible to delete 1 ?")
-    sources[env_value] = airbyte_helpers[env_value].list_sources()
-    connections[env_value] = airbyte_helpers[env_value].list_connections()
 
+def get_airbyte_url():
+    return os.environ["AIRBYTE_URL"]
 
-def init_repo_locally():
-    if os.path.exists(FOLDER):
-        shutil.rmtree(FOLDER)
 
-    Repo.clone_from(
-        f"git@github.com:{repo}.git",
-        FOLDER,
-        branch="main",
-    )
+# Boolean setting: set to anything but "", "0" or "false".
+def env_flag(name):
+    return os.environ.get(name, "") not in ("", "0", "false")
 
 
-TOKEN_GITHUB = os.environ["TOKEN_GITHUB"]
-client = httpx.Client(
-    base_url="https://graph.microsoft.com", headers={"Authorization": f"Bearer {TOKEN_GITHUB}"}
-)
+# Settings of the Migrator read from the environment, with or without SNAPSHOT.
+def settings_from_env():
+    return {
+        "repo_url": os.environ.get("DATA_PRODUCT_REPO_URL", "git@github.com:{repo}.git"),
+        "cache_dir": os.environ.get("DATA_PRODUCT_CACHE_DIR", "data_product_cache"),
+        "split_output": env_flag("SPLIT_OUTPUT"),
+        "strict_variables": env_flag("STRICT_VARIABLES"),
+    }
+
+
+def get_sync_mode(stream):
+    return RULES.sync_mode(stream.sync_mode, stream.destination_sync_mode)
+
+
+# StreamRecord (see octavia_reader.py) => stream of the airbyte_connection resource.
+def stream_to_tf(stream):
+    stream_tf = {
+        "name": stream.name,
+        "sync_mode": get_sync_mode(stream),
+    }
+    if stream.cursor_field:
+        stream_tf["cursor_field"] = stream.cursor_field
+    if stream.primary_key:
+        stream_tf["primary_key"] = stream.primary_key
+    return stream_tf
+
+
+# Connection as returned by the Airbyte API => attributes of the airbyte_connection resource.
+def connection_to_tf(connection, streams, source_path_tf):
+    connection_tf = {
+        # "data_residency": "eu",
+        "destination_id": Expression("airbyte_destination_bigquery.bigquery.destination_id"),
+        "name": connection["name"],
+        "namespace_definition": RULES.namespace_definition(connection["namespaceDefinition"]),
+        "namespace_format": connection["namespaceFormat"],
+        "non_breaking_schema_updates_behavior": connection["nonBreakingChangesPreference"],
+        "source_id": Expression(f"{source_path_tf}.source_id"),
+        "status": connection["status"],
+        "schedule": {
+            "schedule_type": connection["scheduleType"]
+        },
+        "configurations": {
 
+        }
+    }
+    if connection["scheduleType"] == "cron":
+        connection_tf["schedule"]["cron"] = connection["scheduleData"]["cron"]["cronExpression"]
+    elif connection["scheduleType"] != "manual":
+        connection_tf["schedule"]["cron"] = "TODO: Convert to CRON"
 
-def init_output():
-    add_to_output("""
+    connection_tf["configurations"]["streams"] = [stream_to_tf(stream) for stream in streams]
+    return connection_tf
+
+
+# File of a source and of its connections, when the output is split.
+def get_source_file_name(source_path_tf):
+    return f"source_{source_path_tf.split('.')[-1]}.tf"
+
+
+# What is shared by all the data products: the Airbyte helpers, the remote inventory and the GitHub client.
+# Nothing is done before it is needed, so importing this module does no I/O:
+#   migrator = Migrator.from_env()
+#   migrator.load_inventory()
+#   migration = migrator.data_product("my_data_product")
+#   migration.convert()
+#   migration.render()
+# With a snapshot (see snapshot.py) the remote state is read from it, and nothing is fetched at all.
+class Migrator:
+    def __init__(self, git_organization, airbyte_helpers=None, token_github=None, inventory=None,
+                 repo_url="git@github.com:{repo}.git", cache_dir="data_product_cache", gh_secrets=None,
+                 split_output=False, strict_variables=False):
+        self.git_organization = git_organization
+        self.airbyte_helpers = airbyte_helpers
+        self.token_github = token_github
+        self.inventory = inventory
+        # Secrets names by repo, when offline:
+        self.gh_secrets = gh_secrets
+        # e.g. "/srv/git/{repo}.git" to work on local mirrors:
+        self.repo_url = repo_url
+        # Checkouts kept between runs, one per data product:
+        self.cache_dir = cache_dir
+        # One file per source (with its connections) instead of one main.tf, see SplitTfDocument:
+        self.split_output = split_output
+        # References to undeclared variables stop the conversion, instead of being logged, see HclChecker:
+        self.strict_variables = strict_variables
+        self.github_client = None
+
+    @classmethod
+    def from_env(cls):
+        if "SNAPSHOT" in os.environ:
+            return cls.from_snapshot(os.environ["SNAPSHOT"])
+        from airbyte_helper import AirbyteHelper
+        from response_cache import ResponseCache
+
+        # Responses of the read endpoints kept on disk between runs, shared by both envs:
+        response_cache = None
+        if "AIRBYTE_RESPONSE_CACHE_DIR" in os.environ:
+            response_cache = ResponseCache(
+                os.environ["AIRBYTE_RESPONSE_CACHE_DIR"],
+                ttl=int(os.environ.get("AIRBYTE_RESPONSE_CACHE_TTL", "3600")),
+                max_size=int(os.environ.get("AIRBYTE_RESPONSE_CACHE_MAX_MB", "512")) * 1024 * 1024
+            )
+        bypass_cache = env_flag("AIRBYTE_RESPONSE_CACHE_BYPASS")
+        airbyte_helpers = {
+            "dev": AirbyteHelper(
+                os.environ["DEV_AIRBYTE_URL"], os.environ["DEV_AIRBYTE_CLIENT_ID"],
+                os.environ["DEV_AIRBYTE_CLIENT_SECRET"], response_cache=response_cache, bypass_cache=bypass_cache
+            ),
+            "prod": AirbyteHelper(
+                os.environ["PROD_AIRBYTE_URL"], os.environ["PROD_AIRBYTE_CLIENT_ID"],
+                os.environ["PROD_AIRBYTE_CLIENT_SECRET"], response_cache=response_cache, bypass_cache=bypass_cache
+            )
+        }
+        return cls(
+            os.environ["GIT_ORGANIZATION"], airbyte_helpers, os.environ["TOKEN_GITHUB"],
+            **settings_from_env()
+        )
+
+    @classmethod
+    def from_snapshot(cls, path):
+        git_organization, inventory, gh_secrets = load_snapshot(path)
+        return cls(
+            os.environ.get("GIT_ORGANIZATION", git_organization), inventory=inventory, gh_secrets=gh_secrets,
+            **settings_from_env()
+        )
+
+    @property
+    def offline(self):
+        return self.gh_secrets is not None
+
+    def get_repo(self, dp_name):
+        return f"{self.git_organization}/data-product-{dp_name.replace('-', '_')}"
+
+    def load_inventory(self):
+        if self.inventory is None:
+            with TRACER.span("inventory"):
+                self.inventory = load_inventory(self.airbyte_helpers)
+        return self.inventory
+
+    def get_github_client(self):
+        if self.github_client is None:
+            import httpx
+
+            self.github_client = httpx.Client(
+                base_url="https://graph.microsoft.com", headers={"Authorization": f"Bearer {self.token_github}"}
+            )
+        return self.github_client
+
+    def get_gh_secrets(self, repo):
+        if self.offline:
+            return {"secrets": [{"name": name} for name in self.gh_secrets[repo]]}
+        # Secrets are listed 100 per page at most: the "next" links are followed up to the last page.
+        secrets = []
+        url = f"https://api.github.com/repos/{repo}/actions/secrets?per_page=100"
+        while url is not None:
+            response = self.get_github_client().get(url)
+            response.raise_for_status()
+            secrets.extend(response.json()["secrets"])
+            url = response.links.get("next", {}).get("url")
+        return {"total_count": len(secrets), "secrets": secrets}
+
+    def data_product(self, dp_name, output_folder=".", yaml_executor=None):
+        return DataProductMigration(self, dp_name, output_folder, yaml_executor)
+
+
+# Conversion of one data product, see Migrator.
+class DataProductMigration:
+    def __init__(self, migrator, dp_name, output_folder=".", yaml_executor=None):
+        self.migrator = migrator
+        self.dp_name = dp_name
+        self.repo = migrator.get_repo(dp_name)
+        self.folder = f"{migrator.cache_dir}/{self.repo.split('/')[-1]}"
+        self.yaml_executor = yaml_executor
+        self.output_folder = output_folder
+        os.makedirs(output_folder, exist_ok=True)
+        self.fix_github = RULES.fixes_github(dp_name)
+        self.gh_secrets = None
+        # configuration.yaml => (modification time and size, hash), see get_file_hash():
+        self.file_hashes = {}
+        self.cache = ConversionCache(
+            f"{output_folder}/main.tf.cache.json",
+            fingerprint(dp_name, migrator.load_inventory().fingerprint(), code_fingerprint())
+        )
+        self.init_run()
+
+    # State of one conversion. A long-running process (see watch.py) calls reset() before converting again.
+    def init_run(self):
+        # Own Terraform paths, on the shared remote resources:
+        self.inventory = self.migrator.load_inventory().fork()
+        # Terraform path => model of the resource, see add_model():
+        self.models = {}
+        self.models_recording = None
+        # Each block is formatted and validated as soon as it is rendered:
+        self.checker = HclChecker(strict=self.migrator.strict_variables)
+        if self.migrator.split_output:
+            self.document = SplitTfDocument(self.output_folder, post_process=self.checker)
+        else:
+            self.document = TfDocument(f"{self.output_folder}/main.tf", post_process=self.checker)
+
+    def reset(self):
+        self.document.discard()
+        self.cache.next_run()
+        self.init_run()
+
+    def run(self):
+        self.convert()
+        return self.render()
+
+    # Generates all the blocks, streamed to the document. Without checkout, the local files are used as they are.
+    def convert(self, checkout=True):
+        for env in self.inventory.envs:
+            if len(self.inventory.destinations[env]) > 1 and "sp_lm" in self.dp_name:
+                raise Exception("We made the script working for only one destination. Is it possible to delete 1 ?")
+        if checkout:
+            with TRACER.span("checkout", dp_name=self.dp_name):
+                self.init_repo_locally()
+        self.init_output()
+        with TRACER.span("secrets", dp_name=self.dp_name):
+            self.create_vars_for_secrets()
+        self.create_global_vars()
+        self.add_bq_tf()
+        with TRACER.span("octavia", dp_name=self.dp_name):
+            self.treat_all_octavia()
+
+    def render(self):
+        with TRACER.span("write", dp_name=self.dp_name):
+            return self.write_tf_file()
+
+    def init_repo_locally(self):
+        if self.migrator.offline and os.path.exists(self.folder):
+            logger.info("Offline: %s used as is", self.folder)
+            return
+        sync_checkout(
+            self.migrator.repo_url.format(repo=self.repo), self.folder, branch="main", sparse_paths=["airbyte"]
+        )
+
+    def init_output(self):
+        self.add_to_output(TfBlock("""
 terraform {
   required_providers {
     airbyte = {
@@ -72,31 +283,20 @@ terraform {
   backend "gcs" {
   }
 }
-    """)
-
-
-def get_gh_secrets():
-    response = client.get(f"https://api.github.com/repos/{repo}/actions/secrets")
-    return response.json()
-
-
-def get_airbyte_url():
-    return os.environ["AIRBYTE_URL"]
-
-
-def create_global_vars():
-    add_to_output(
-        f"""
-variable "WORKSPACE_ID" {{
-  description = "ID of the Airbyte Workspace."
-}}
-
-variable "ENV" {{
-  description = "Environment. 'dev' or 'prod'"
-}}
-
+    """))
+
+    def get_gh_secrets(self):
+        if self.gh_secrets is None:
+            self.gh_secrets = self.migrator.get_gh_secrets(self.repo)
+        return self.gh_secrets
+
+    def create_global_vars(self):
+        self.add_to_output(VariableBlock("WORKSPACE_ID", "ID of the Airbyte Workspace."))
+        self.add_to_output(VariableBlock("ENV", "Environment. 'dev' or 'prod'"))
+        self.add_to_output(TfBlock(
+            f"""
 locals {{
-  bigquery_gcp_project = "{DP_NAME.replace("_", "-")}-${{var.ENV}}"
+  bigquery_gcp_project = "{self.dp_name.replace("_", "-")}-${{var.ENV}}"
 }}
 
 data \"google_secret_manager_secret_version\" \"airbyte_ingestion_account_secret\" {{
@@ -116,68 +316,62 @@ data \"google_secret_manager_secret_version\" \"airbyte_ingestion_airbyte_hmac_k
   secret  = \"${{local.bigquery_gcp_project}}-airbyte_hmac_key_id\"
   version = "latest"
 }}
-
-
-
 """
-    )
-
-
-def create_vars_for_secrets():
-    secrets = get_gh_secrets()
-    unique_secrets = set([secret["name"].replace("DEV_", "").replace("PROD_", "") for secret in secrets["secrets"]])
-    for secret in unique_secrets:
-        if secret in ["INGESTION_ACCOUNT_HMAC_KEY_ID", "INGESTION_ACCOUNT_HMAC_KEY_SECRET",
-                      "INGESTION_ACCOUNT_SECRET_JSON", "AIRBYTE_URL"]:
-            # Already handled by Google Secrets
-            continue
-        var_content = f"""
-variable "{secret}" {{
-  description = "Variable for {secret}."
-  sensitive   = true
-}}
-        """
-        add_to_output(var_content)
-
-    add_to_output(
-
-        f"""
-        
-variable "AIRBYTE_URL" {{
-  description = "Url of Airbyte."
-}}
-
-provider "airbyte" {{
+        ))
+
+    def create_vars_for_secrets(self):
+        secrets = self.get_gh_secrets()
+        unique_secrets = set([secret["name"].replace("DEV_", "").replace("PROD_", "") for secret in secrets["secrets"]])
+        # Sorted: the order of a set changes from a run to another, and would rewrite the file every time.
+        for secret in sorted(unique_secrets):
+            if secret in ["INGESTION_ACCOUNT_HMAC_KEY_ID", "INGESTION_ACCOUNT_HMAC_KEY_SECRET",
+                          "INGESTION_ACCOUNT_SECRET_JSON", "AIRBYTE_URL"]:
+                # Already handled by Google Secrets
+                continue
+            self.add_to_output(VariableBlock(secret, f"Variable for {secret}.", sensitive=True))
+
+        self.add_to_output(VariableBlock("AIRBYTE_URL", "Url of Airbyte."))
+        self.add_to_output(ProviderBlock(
+            "airbyte",
+            """{
   password = var.AIRBYTE_CLIENT_SECRET
   username = var.AIRBYTE_CLIENT_ID
 
-  server_url = "${{var.AIRBYTE_URL}}/api/public/v1"
-}}
-            """
-    )
-
-
-def add_bq_tf():
-    remote_destination_found = {}
-    for env in all_envs:
-        remote_destination_found[env] = [destination for destination in destinations[env]]
-    add_import_for_all_envs(f'airbyte_destination_bigquery.bigquery', remote_destination_found, "destinationId")
-    add_to_output(
-        """
-resource "airbyte_destination_bigquery" "bigquery" {
-  name          = "BigQuery"
+  server_url = "${var.AIRBYTE_URL}/api/public/v1"
+}"""
+        ))
+
+    def add_bq_tf(self):
+        with self.document.section("destinations.tf"):
+            self.add_bq_destination()
+
+    def add_bq_destination(self):
+        remote_destination_found = {}
+        for env in self.inventory.envs:
+            remote_destination_found[env] = [destination for destination in self.inventory.destinations[env]]
+        self.add_import_for_all_envs(
+            f'airbyte_destination_bigquery.bigquery', remote_destination_found, "destinationId"
+        )
+        self.add_model("destinations", "airbyte_destination_bigquery.bigquery", remote_destination_found, {
+            "name": "BigQuery"
+        })
+        self.add_to_output(ResourceBlock(
+            "airbyte_destination_bigquery",
+            "bigquery",
+            """{
+  name = "BigQuery"
   configuration = {
     big_query_client_buffer_size_mb = 15
     credentials_json                = data.google_secret_manager_secret_version.airbyte_ingestion_account_secret.secret_data
     dataset_id                      = "airbyte_ingestion"
     dataset_location                = "EU"
     disable_type_dedupe             = false
-    loading_method                  = {
+    loading_method = {
       gcs_staging = {
         credential = {
           hmac_key = {
-            hmac_key_access_id = data.google_secret_manager_secret_version.airbyte_ingestion_airbyte_hmac_key_id.secret_data  # noqa
-            hmac_key_secret    = data.google_secret_manager_secret_version.airbyte_ingestion_airbyte_hmac_key_secret.secret_data  # noqa
+            hmac_key_access_id = data.google_secret_manager_secret_version.airbyte_ingestion_airbyte_hmac_key_id.secret_data     # noqa
+            hmac_key_secret    = data.google_secret_manager_secret_version.airbyte_ingestion_airbyte_hmac_key_secret.secret_data # noqa
           }
         }
         gcs_bucket_name          = "${local.bigquery_gcp_project}-airbyte-ingestion"
@@ -185,229 +379,153 @@ resource "airbyte_destination_bigquery" "bigquery" {
         keep_files_in_gcs_bucket = "Keep all tmp files in GCS"
       }
     }
-    project_id              = "${local.bigquery_gcp_project}"
+    project_id              = local.bigquery_gcp_project
     transformation_priority = "interactive"
   }
-  definition_id = "22f6c74f-5699-40ff-833c-4a879ea40133"
-  workspace_id  = var.WORKSPACE_ID
-}
-    
-        """)
-
-
-def treat_all_octavia():
-    for root, dirs, files in os.walk(f"{FOLDER}/airbyte/", topdown=True):
-        dirs.sort(reverse=True)
-        for name in files:
-            print("#", root, dirs, files)
-            if name == "configuration.yaml":
-                file_path = f"{root}/configuration.yaml"
-                content = yaml.safe_load(Path(file_path).read_text())
-                if "/sources/" in file_path:
-                    convert_source(file_path, content)
-                if "/connections/" in file_path:
-                    convert_connections(file_path, content)
-
-
-def convert_source(file_path, content):
-    source_name = file_path.split("/")[3]
-
-    remote_source_found = {}
-    for env in all_envs:
-        remote_source_found[env] = [source for source in sources[env] if source["name"] == content["resource_name"]]
-    if any(len(remote_source_found[env]) > 1 for env in all_envs):
-        raise Exception("Too much sources found")
-
-    del content["definition_type"]
-    del content["definition_version"]
-    content["name"] = content["resource_name"]
-    del content["resource_name"]
-    tf_package = content["definition_image"].replace("/", "_").replace("-", "_")
-    del content["definition_image"]
-    content["workspace_id"] = "${var.WORKSPACE_ID}"
-
-    add_to_output("\n\n\n")
-
-    source_tf_name = source_name.replace(' ', '_')
-    source_path_tf = f"{tf_package}.{source_tf_name}"
-    for env in all_envs:
-        source_id_to_tf_name[remote_source_found[env][0]["sourceId"]] = source_path_tf
-
-    add_import_for_all_envs(f'{source_path_tf}', remote_source_found, "sourceId")
-
-    add_to_output(f"resource \"{tf_package}\" \"{source_name}\"")
-    source_tf = json_to_tf(content)
-    source_tf = add_var_to_secrets(source_tf)
-
-    add_to_output(source_tf)
-
-
-def fix_github_source(source_tf):
-    founds = re.findall(r"credentials *= *{.*\"OAuth Credentials\"\n *}", source_tf, re.DOTALL)
-    for found in founds:
-        source_tf = source_tf.replace(
-            found, "credentials = { personal_access_token = { personal_access_token = var.ACCESS_TOKEN } }"
+  # definition_id = "22f6c74f-5699-40ff-833c-4a879ea40133"
+  workspace_id = var.WORKSPACE_ID
+}"""
+        ))
+
+    def treat_all_octavia(self):
+        file_paths = find_configurations(self.folder)
+        self.treat_configurations(
+            [file_path for file_path in file_paths if "/sources/" in file_path], self.convert_source
+        )
+        # The connections reference the sources by their Terraform path: cached only while those are the same.
+        self.treat_configurations(
+            [file_path for file_path in file_paths if "/connections/" in file_path], self.convert_connections,
+            self.inventory.tf_paths
         )
-    return source_tf
-
-
-def add_var_to_secrets(source_tf):
-    founds = re.findall(r"\${[^var].*}", source_tf)
-    for found in founds:
-        source_tf = source_tf.replace(found, found.replace("${", "${var."))
-    return source_tf
-
-
-def add_import_for_all_envs(tf_path, remote_ids, id_key):
-    add_to_output(f"""
-import {{
-  for_each = toset(var.ENV == \"dev\" ? [{{unique_id: \"{remote_ids["dev"][0][id_key]}\"}}] : [{{unique_id: \"{remote_ids["prod"][0][id_key]}\"}}])  # noqa
-  to = {tf_path}
-  id = each.value.unique_id
-}}
-        """)
-
-
-def get_sync_mode(stream):
-    sync_mode = stream["config"]["sync_mode"] + "_" + stream["config"]["destination_sync_mode"]
-    return sync_mode.replace("incremental_append_dedup", "incremental_deduped_history")
-
-
-def convert_connections(file_path, content):
-    connection_name = file_path.split("/")[3]
-
-    remote_connection_found = {}
-    for env in all_envs:
-        remote_connection_found[env] = [conn for conn in connections[env] if conn["name"] == content["resource_name"]]
-    if any(len(remote_connection_found[env]) > 1 for env in all_envs):
-        raise Exception("Too much remote_connections found")
-
-    connection = remote_connection_found[PROD_ENV][0]
-    connection_tf = {
-        # "data_residency": "eu",
-        "destination_id": "${airbyte_destination_bigquery.bigquery.destination_id}",
-        "name": connection["name"],
-        "namespace_definition": connection["namespaceDefinition"].replace("customformat", "custom_format"),
-        "namespace_format": connection["namespaceFormat"],
-        "non_breaking_schema_updates_behavior": connection["nonBreakingChangesPreference"],
-        "source_id": f"${{{source_id_to_tf_name[connection['sourceId']]}.source_id}}",
-        "status": connection["status"],
-        "schedule": {
-            "schedule_type": connection["scheduleType"]
-        },
-        "configurations": {
-
-        }
-    }
-    if connection["scheduleType"] == "cron":
-        connection_tf["schedule"]["cron"] = connection["scheduleData"]["cron"]["cronExpression"]
-    elif connection["scheduleType"] != "manual":
-        connection_tf["schedule"]["cron"] = "TODO: Convert to CRON"
 
-    connection_tf["configurations"]["streams"] = []
-    for stream in content["configuration"]["sync_catalog"]["streams"]:
-        stream_tf = {
-            "name": stream["stream"]["name"],
-            "sync_mode": get_sync_mode(stream),
-            "cursor_field": stream["stream"]["default_cursor_field"],
-            "primary_key": stream["config"]["primary_key"],
+    def treat_configurations(self, file_paths, convert, dependencies=None):
+        # The dependencies (all the Terraform paths of the sources) are hashed once, not once per file:
+        dependencies_hash = fingerprint(dependencies)
+        keys = {file_path: fingerprint(self.get_file_hash(file_path), dependencies_hash) for file_path in file_paths}
+        cached = {file_path: self.cache.contains(file_path, keys[file_path]) for file_path in file_paths}
+        # Only the changed configurations are parsed (in parallel), then converted in the order of the files:
+        contents = read_configurations(
+            [file_path for file_path in file_paths if not cached[file_path]], executor=self.yaml_executor
+        )
+        for file_path in file_paths:
+            if cached[file_path]:
+                entry = self.cache.get(file_path, keys[file_path])
+                logger.debug("# cached %s", file_path)
+                with TRACER.span(file_path, "file", cached=True):
+                    # The blocks were validated when converted, but the secrets they use may have been removed since:
+                    self.checker.check_variables(file_path, entry["variables"])
+                    self.inventory.tf_paths.update(entry["tf_paths"])
+                    self.models.update(entry["models"])
+                    for kind, content, file_name in entry["blocks"]:
+                        self.document.write(content, kind, file_name)
+                continue
+            with TRACER.span("yaml_parse"):
+                _, content = next(contents)
+            logger.debug("# %s", file_path)
+            with TRACER.span(file_path, "file", cached=False):
+                with self.document.record() as blocks, self.inventory.record_tf_paths() as tf_paths, \
+                        self.record_models() as models, self.checker.record() as variables:
+                    convert(file_path, content)
+            self.cache.put(file_path, keys[file_path], blocks, tf_paths, models, sorted(variables))
+
+    # Hash of a configuration, read again only when its modification time or size changed since the last
+    # conversion (in a long-running process, see watch.py).
+    def get_file_hash(self, file_path):
+        stat = os.stat(file_path)
+        found = self.file_hashes.get(file_path)
+        if found is None or found[0] != (stat.st_mtime_ns, stat.st_size):
+            found = ((stat.st_mtime_ns, stat.st_size), file_hash(file_path))
+            self.file_hashes[file_path] = found
+        return found[1]
+
+    def convert_source(self, file_path, content):
+        source_name = Path(file_path).parent.name
+
+        remote_source_found = self.inventory.find_by_name("sources", content["resource_name"])
+        if self.inventory.is_duplicated("sources", content["resource_name"]):
+            raise Exception("Too much sources found")
+
+        del content["definition_type"]
+        del content["definition_version"]
+        content["name"] = content["resource_name"]
+        del content["resource_name"]
+        tf_package = RULES.resource_type(content["definition_image"])
+        del content["definition_image"]
+        content["workspace_id"] = Expression("var.WORKSPACE_ID")
+
+        source_tf_name = source_name.replace(' ', '_')
+        source_path_tf = f"{tf_package}.{source_tf_name}"
+        self.inventory.set_tf_path("sources", remote_source_found, source_path_tf)
+
+        RULES.convert_source(content, self.fix_github)
+
+        self.add_model("sources", source_path_tf, remote_source_found, {
+            "name": content["name"], "configuration": content["configuration"]
+        })
+
+        with self.document.section(get_source_file_name(source_path_tf)):
+            self.add_import_for_all_envs(f'{source_path_tf}', remote_source_found, "sourceId")
+            self.add_to_output(ResourceBlock(tf_package, source_name, content))
+
+    # Comparable form of what is generated for the imported remote resources, see drift_check.py.
+    def add_model(self, resource_type, tf_path, remote_found, model):
+        paths = model_paths(model)
+        self.models[tf_path] = {
+            "resource_type": resource_type,
+            "remote_ids": {env: remote_found[env][0][ID_KEYS[resource_type]] for env in ["dev", "prod"]},
+            "paths": paths,
+            "hash": model_hash(paths),
         }
-        connection_tf["configurations"]["streams"].append(stream_tf)
-
-    tf_package = "airbyte_connection"
-    connection_name_tf = f"{tf_package}_{connection_name.replace(' ', '_')}"
-    connection_path_tf = f"{tf_package}.{connection_name_tf}"
-
-    add_to_output("\n\n\n")
-
-    add_import_for_all_envs(f'{connection_path_tf}', remote_connection_found, "connectionId")
-
-    add_to_output(f"resource \"{tf_package}\" \"{connection_name_tf}\"")
-    connection_tf = json_to_tf(connection_tf)
-    # connection_tf = add_var_to_secrets(connection_tf)
-    add_to_output(connection_tf)
-
-
-def json_to_tf(json_content):
-    tf_str = json.dumps(json_content, indent=4, separators=('', ' = '))
-    tf_str = "\n".join([format_line(line) for line in tf_str.split("\n")])
-
-    founds = re.findall(r"\[[^{]*]", tf_str, re.DOTALL)
-    for found in founds:
-        tf_str = tf_str.replace(found, found.replace("}", "},"))
-
-    return tf_str
-
-
-def format_line(line):
-    if " = " in line:
-        key, value = line.split(" = ")
-        key = key.replace("\"", "")
-        return f"{key} = {value}"
-    return line
-
-
-def add_to_output(content):
-    global OUTPUT
-    OUTPUT += content + "\n"
-
-
-def write_tf_file(output_tf):
-    with open('main.tf', 'w') as file:
-        file.write(output_tf)
-    print("terraform fmt")
-    os.system('terraform fmt')
-
-
-def clean_file_to_valid_tf():
-    global OUTPUT
-
-    # Remove all the double quotes around the variables:
-    founds = re.findall(r"\"\${.*}\"", OUTPUT)
-    for found in founds:
-        if "SOURCE_NAMESPACE" in found:
-            continue
-        OUTPUT = OUTPUT.replace(found, found.replace("\"${", "").replace("}\"", ""))
-
-    # Special case in Airbyte: If "${SOURCE_NAMESPACE}" then behaves like namespaceDefinition = 'source'.
-    OUTPUT = OUTPUT.replace("${SOURCE_NAMESPACE}", "$${SOURCE_NAMESPACE}")
-    # Needed for resource
-    OUTPUT = OUTPUT.replace("\n{", "{")
-
-    # Handles Arrays:
-    founds = re.findall(r"] *\n *\[", OUTPUT)
-    for found in founds:
-        OUTPUT = OUTPUT.replace(found, found.replace("]", "],"))
-
-    # Handles Arrays:
-    founds = re.findall(r"} *\n *\{", OUTPUT)
-    for found in founds:
-        OUTPUT = OUTPUT.replace(found, found.replace("}", "},"))
-
-    if "_github_" in DP_NAME:
-        OUTPUT = fix_github_source(OUTPUT)
-
-    # Due to a bug in Airbyte, https://github.com/airbytehq/terraform-provider-airbyte/issues/88
-    # we need to replace definition_id by # definition_id:
-    OUTPUT = OUTPUT.replace("definition_id", "# definition_id")
-
-    OUTPUT = OUTPUT.replace("airbyte_source_declarative_manifest", "airbyte_source_custom")
-
-    OUTPUT = OUTPUT.replace("primary_key = []", "")
-    OUTPUT = OUTPUT.replace("cursor_field = []", "")
-
-
-
-
-init_output()
-source_id_to_tf_name = {}
-init_repo_locally()
-create_vars_for_secrets()
-create_global_vars()
-add_bq_tf()
-treat_all_octavia()
+        if self.models_recording is not None:
+            self.models_recording[tf_path] = self.models[tf_path]
+
+    # Collects the models added in the `with` statement.
+    @contextmanager
+    def record_models(self):
+        self.models_recording = {}
+        try:
+            yield self.models_recording
+        finally:
+            self.models_recording = None
+
+    def add_import_for_all_envs(self, tf_path, remote_ids, id_key):
+        self.add_to_output(ImportBlock(tf_path, {env: remote_ids[env][0][id_key] for env in ["dev", "prod"]}))
+
+    def convert_connections(self, file_path, content):
+        connection_name = Path(file_path).parent.name
+
+        remote_connection_found = self.inventory.find_by_name("connections", content["resource_name"])
+        if self.inventory.is_duplicated("connections", content["resource_name"]):
+            raise Exception("Too much remote_connections found")
+
+        connection = remote_connection_found[PROD_ENV][0]
+        source_path_tf = self.inventory.get_tf_path(connection['sourceId'])
+        streams = content["configuration"]["sync_catalog"]["streams"]
+        connection_tf = connection_to_tf(connection, streams, source_path_tf)
+
+        tf_package = "airbyte_connection"
+        connection_name_tf = f"{tf_package}_{connection_name.replace(' ', '_')}"
+        connection_path_tf = f"{tf_package}.{connection_name_tf}"
+        self.add_model("connections", connection_path_tf, remote_connection_found, connection_tf)
+
+        with self.document.section(get_source_file_name(source_path_tf)):
+            self.add_import_for_all_envs(f'{connection_path_tf}', remote_connection_found, "connectionId")
+            self.add_to_output(ResourceBlock(tf_package, connection_name_tf, connection_tf))
+
+    def add_to_output(self, block):
+        self.document.add(block)
+
+    def write_tf_file(self):
+        self.document.close()
+        self.cache.save()
+        summary = f"{self.document.path} written: {self.document.summary()}"
+        logger.info(summary)
+        logger.info(
+            "%s configurations reused from %s, %s converted", self.cache.hits, self.cache.path, self.cache.misses
+        )
+        return summary
 
-clean_file_to_valid_tf()
-print(OUTPUT)
 
-write_tf_file(OUTPUT)
+if __name__ == "__main__":
+    with instrumented_from_env():
+        Migrator.from_env().data_product(os.environ["DP_NAME"]).run()
@@ -0,0 +1,25 @@
+import os
+
+
+# Brings `folder` to the head of `branch` of `url`, reusing the existing checkout: only the last commit is
+# fetched (depth), and only `sparse_paths` are checked out. Works the same with a local (bare) repository.
+def sync_checkout(url, folder, branch="main", depth=1, sparse_paths=None):
+    # Imported on first use: GitPython runs git when imported.
+    from git import Repo
+
+    if os.path.exists(os.path.join(folder, ".git")):
+        repo = Repo(folder)
+        repo.remotes.origin.set_url(url)
+    else:
+        repo = Repo.init(folder)
+        repo.create_remote("origin", url)
+    if sparse_paths:
+        repo.git.sparse_checkout("set", *sparse_paths)
+    fetch_options = {"depth": depth}
+    if sparse_paths and not os.path.exists(url):
+        # Blobs outside of the sparse paths are never downloaded:
+        fetch_options["filter"] = "blob:none"
+    repo.git.fetch("origin", f"+refs/heads/{branch}:refs/remotes/origin/{branch}", **fetch_options)
+    repo.git.checkout("-f", "-B", branch, f"origin/{branch}")
+    repo.git.clean("-ffdx")
+    return repo
@@ -0,0 +1,244 @@
+import logging
+import re
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Tokens of a line of HCL, after the spaces: a quoted string without interpolation is one value, as is
+# an identifier with the "=" after it. The other strings start with a quote, and are read with STRING_TOKEN_PATTERN.
+TOKEN_PATTERN = re.compile(r"""\s*(?:
+    (?P<string>"(?:[^"\\$%]|\\.|[$%](?![{$%])|\$\$\{|%%\{)*")
+    |(?P<quote>")
+    |(?P<open>[{\[(])
+    |(?P<close>[}\])])
+    |(?P<comma>,)
+    |(?P<comment>\#|//)
+    |(?P<block_comment>/\*)
+    |(?P<heredoc><<-?(?P<heredoc_end>[A-Za-z_][A-Za-z0-9_]*)\s*$)
+    |(?P<var>(?<![\w.])var\.(?P<var_name>[A-Za-z_][A-Za-z0-9_-]*))
+    |(?P<value>[\w.\-]+(?:\s*=(?![=>]))?|\S)
+)""", re.VERBOSE)
+# Inside a string: STRING_PATTERN skips the plain text, then only quote and template matter. The escapes, the
+# literal "$${" and "%%{", and any other "$" or "%" are text.
+STRING_PATTERN = re.compile(r"(?:[^\"\\$%]|[$%](?![{$%]))*")
+STRING_TOKEN_PATTERN = re.compile(r"""(?:
+    (?P<escape>\\.)
+    |(?P<literal_template>\$\$\{|%%\{)
+    |(?P<template>[$%]\{)
+    |(?P<quote>")
+    |(?P<text>.)
+)""", re.VERBOSE)
+ATTRIBUTE_PATTERN = re.compile(r'^([A-Za-z_][A-Za-z0-9_-]*|"(?:[^"\\]|\\.)*")\s*=(?!=)\s*(.*)$')
+VARIABLE_PATTERN = re.compile(r'^variable\s+"([^"]+)"')
+CLOSING = {"{": "}", "[": "]", "(": ")", "${": "}"}
+
+
+class HclError(Exception):
+    pass
+
+
+# Structure of a text of HCL, line by line. Quoted strings and interpolations are followed, so the braces, commas
+# and references inside the strings are told apart from the ones of the code. Any problem found is in `problems`.
+class HclScan:
+    def __init__(self, text):
+        self.lines = text.split("\n")
+        self.problems = []
+        # var.NAME referenced: (name, line number)
+        self.references = []
+        # Per line: depth at its start, None for the lines kept as is (heredocs, block comments)
+        self.depths = []
+        # Per line: closing brackets it starts with, and depth at its end
+        self.leading_closers = []
+        self.end_depths = []
+        self.scan()
+
+    def scan(self):
+        # Open brackets and interpolations: (opening, line number)
+        stack = []
+        heredoc_end = None
+        in_block_comment = False
+        previous = "open"
+        missing_comma_line = None
+
+        for number, line in enumerate(self.lines, 1):
+            self.depths.append(None if heredoc_end or in_block_comment else len(stack))
+            self.leading_closers.append(0)
+            if heredoc_end is not None:
+                if line.strip() == heredoc_end:
+                    heredoc_end = None
+                self.end_depths.append(len(stack))
+                continue
+            position = 0
+            if in_block_comment:
+                position = line.find("*/")
+                if position < 0:
+                    self.end_depths.append(len(stack))
+                    continue
+                in_block_comment = False
+                position += 2
+            in_string = False
+            leading = True
+            while position < len(line):
+                if in_string:
+                    position = STRING_PATTERN.match(line, position).end()
+                    match = STRING_TOKEN_PATTERN.match(line, position)
+                    if match is None:
+                        break
+                    position = match.end()
+                    kind = match.lastgroup
+                    if kind == "quote":
+                        in_string = False
+                        previous = "value"
+                    elif kind == "template":
+                        stack.append(("${", number))
+                        in_string = False
+                        previous = "open"
+                    continue
+                match = TOKEN_PATTERN.match(line, position)
+                if match is None:
+                    break
+                position = match.end()
+                kind = match.lastgroup
+                if kind in ("comment", "block_comment"):
+                    if kind == "block_comment":
+                        end = line.find("*/", position)
+                        if end >= 0:
+                            position = end + 2
+                            continue
+                        in_block_comment = True
+                    break
+                if missing_comma_line is not None:
+                    if kind not in ("comma", "close"):
+                        self.problems.append(f"line {missing_comma_line}: missing comma after the item")
+                    missing_comma_line = None
+                if kind == "close":
+                    closer = match.group("close")
+                    if not stack or CLOSING[stack[-1][0]] != closer:
+                        expected = f"{CLOSING[stack[-1][0]]!r} of line {stack[-1][1]}" if stack else "nothing"
+                        self.problems.append(f"line {number}: unexpected {closer!r}, expected {expected}")
+                    else:
+                        opening, _ = stack.pop()
+                        if leading:
+                            self.leading_closers[-1] += 1
+                        if opening == "${":
+                            in_string = True
+                            continue
+                    previous = "value"
+                    continue
+                leading = False
+                if kind == "open":
+                    stack.append((match.group("open"), number))
+                    previous = "open"
+                elif kind == "comma":
+                    if not stack or stack[-1][0] == "${":
+                        self.problems.append(f"line {number}: comma outside of a list, object or call")
+                    elif previous != "value":
+                        self.problems.append(f"line {number}: comma without an item before it")
+                    previous = "comma"
+                elif kind == "quote":
+                    in_string = True
+                elif kind == "heredoc":
+                    heredoc_end = match.group("heredoc_end")
+                    previous = "value"
+                    break
+                elif kind == "var":
+                    self.references.append((match.group("var_name"), number))
+                    previous = "value"
+                else:
+                    # After an "=", a value is expected as after an opening bracket:
+                    previous = "open" if kind == "value" and match.group("value").endswith("=") else "value"
+            # Quoted strings, and so their interpolations, end on the line they start:
+            if in_string or (stack and stack[-1][0] == "${"):
+                self.problems.append(f"line {number}: unterminated string")
+                in_string = False
+                while stack and stack[-1][0] == "${":
+                    stack.pop()
+            # Items of a multi-line list are separated by commas:
+            if stack and stack[-1][0] == "[" and previous == "value" and not in_block_comment:
+                missing_comma_line = number
+            self.end_depths.append(len(stack))
+
+        for opening, number in stack:
+            self.problems.append(f"line {number}: {opening!r} never closed")
+        if heredoc_end is not None:
+            self.problems.append(f"heredoc {heredoc_end} never closed")
+
+
+# Canonical layout of `terraform fmt` (and of hcl_writer.py): indented by 2 spaces per level, no trailing spaces,
+# and the "=" of consecutive single line attributes aligned. Heredocs and block comments are kept as is.
+def format_hcl(text, scan=None):
+    if scan is None:
+        scan = HclScan(text)
+    lines = []
+    group = []
+
+    def close_group():
+        width = max(len(key) for _, key, _ in group)
+        lines.extend(f"{padding}{key.ljust(width)} = {value}" for padding, key, value in group)
+        group.clear()
+
+    for line, depth, leading_closers, end_depth in zip(scan.lines, scan.depths, scan.leading_closers,
+                                                        scan.end_depths):
+        if depth is None:
+            if group:
+                close_group()
+            lines.append(line)
+            continue
+        stripped = line.strip()
+        padding = "  " * max(depth - leading_closers, 0)
+        attribute = ATTRIBUTE_PATTERN.match(stripped) if end_depth == depth else None
+        if attribute is not None:
+            group.append((padding, attribute.group(1), attribute.group(2)))
+            continue
+        if group:
+            close_group()
+        lines.append(padding + stripped if stripped else "")
+    if group:
+        close_group()
+    return "\n".join(lines)
+
+
+# Formats and validates each block before it is written (post_process of TfDocument): a block that is not valid
+# HCL stops the conversion. The variables referenced must be declared by a previous `variable` block (or given
+# in declared_variables); they are logged, or with strict raise an HclError, otherwise.
+class HclChecker:
+    def __init__(self, declared_variables=(), strict=False):
+        self.declared_variables = set(declared_variables)
+        self.strict = strict
+        self.undeclared_variables = set()
+        self.variables_recording = None
+
+    def __call__(self, content):
+        scan = HclScan(content)
+        header = scan.lines[0].rstrip(" {")
+        if scan.problems:
+            raise HclError(f"Invalid HCL in {header}: " + "; ".join(scan.problems))
+        for line, depth in zip(scan.lines, scan.depths):
+            variable = VARIABLE_PATTERN.match(line) if depth == 0 else None
+            if variable is not None:
+                self.declared_variables.add(variable.group(1))
+        variables = {name for name, _ in scan.references}
+        if self.variables_recording is not None:
+            self.variables_recording.update(variables)
+        self.check_variables(header, variables)
+        return format_hcl(content, scan)
+
+    # Also called with the variables referenced by blocks checked in a previous run (see tf_cache.py), which may
+    # not be declared anymore.
+    def check_variables(self, header, variables):
+        undeclared = sorted({name for name in variables if name not in self.declared_variables})
+        if undeclared:
+            self.undeclared_variables.update(undeclared)
+            message = f"Undeclared variables in {header}: {', '.join(undeclared)}"
+            if self.strict:
+                raise HclError(message)
+            logger.warning(message)
+
+    # Collects the variables referenced by the blocks checked in the `with` statement.
+    @contextmanager
+    def record(self):
+        self.variables_recording = set()
+        try:
+            yield self.variables_recording
+        finally:
+            self.variables_recording = None
@@ -0,0 +1,102 @@
+import json
+import re
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_-]*")
+ESCAPES = {"\\": "\\\\", "\"": "\\\"", "\n": "\\n", "\r": "\\r", "\t": "\\t"}
+ESCAPE_PATTERN = re.compile(r"[\\\"\n\r\t]|[$%]\{")
+
+
+# Raw HCL expression, written as is (references, functions, templates...)
+class Expression:
+    def __init__(self, expression):
+        self.expression = expression
+
+    def __repr__(self):
+        return f"Expression({self.expression!r})"
+
+
+# Attribute written commented out, e.g. `# definition_id = "..."`: kept for the reader, ignored by Terraform.
+class CommentedOut:
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return f"CommentedOut({self.value!r})"
+
+
+def escape_string(value):
+    def escape(match):
+        found = match.group(0)
+        # ${ and %{ start a template sequence in HCL: doubled to be kept as literal.
+        return ESCAPES.get(found, found[0] + found)
+    return ESCAPE_PATTERN.sub(escape, value)
+
+
+def quote(value):
+    return "\"" + escape_string(value) + "\""
+
+
+# Quoted string of parts: the str are literal text, escaped, and the Expressions are interpolated.
+def template(parts):
+    return Expression("\"" + "".join(
+        f"${{{part.expression}}}" if isinstance(part, Expression) else escape_string(part) for part in parts
+    ) + "\"")
+
+
+def format_key(key):
+    return key if IDENTIFIER_PATTERN.fullmatch(key) else quote(key)
+
+
+def to_hcl(value, indent=0):
+    if isinstance(value, Expression):
+        return value.expression
+    if isinstance(value, CommentedOut):
+        return to_hcl(value.value, indent)
+    if isinstance(value, dict):
+        return object_to_hcl(value, indent)
+    if isinstance(value, (list, tuple)):
+        return list_to_hcl(value, indent)
+    if isinstance(value, str):
+        return quote(value)
+    if value is None or isinstance(value, (bool, int, float)):
+        return json.dumps(value)
+    raise TypeError(f"Cannot convert {type(value).__name__} to HCL: {value!r}")
+
+
+# Same layout as `terraform fmt`: the "=" of consecutive single line attributes are aligned,
+# and an attribute opening a multi-line value, or commented out, ends the alignment group.
+def object_to_hcl(attributes, indent=0):
+    if len(attributes) == 0:
+        return "{}"
+    padding = " " * (indent + 2)
+    lines = []
+    group = []
+
+    def close_group():
+        width = max(len(key) for key, _ in group)
+        lines.extend(f"{padding}{key.ljust(width)} = {value}" for key, value in group)
+        group.clear()
+
+    for key, value in attributes.items():
+        prefix = ""
+        if isinstance(value, CommentedOut):
+            prefix, value = "# ", value.value
+        key = format_key(key)
+        value = to_hcl(value, indent + 2)
+        if "\n" in value or prefix:
+            if group:
+                close_group()
+            lines.append(f"{padding}{prefix}{key} = {value}")
+        else:
+            group.append((key, value))
+    if group:
+        close_group()
+    return "{\n" + "\n".join(lines) + "\n" + " " * indent + "}"
+
+
+def list_to_hcl(values, indent=0):
+    items = [to_hcl(value, indent + 2) for value in values]
+    if not any("\n" in item for item in items):
+        return "[" + ", ".join(items) + "]"
+    padding = " " * (indent + 2)
+    return "[\n" + "".join(f"{padding}{item},\n" for item in items) + " " * indent + "]"
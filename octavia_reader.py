@@ -0,0 +1,126 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+from yaml.composer import Composer
+from yaml.constructor import SafeConstructor
+from yaml.events import CollectionEndEvent, CollectionStartEvent, MappingEndEvent
+from yaml.nodes import MappingNode, ScalarNode
+from yaml.parser import Parser
+from yaml.reader import Reader
+from yaml.resolver import Resolver
+from yaml.scanner import Scanner
+
+# The libyaml parser is much faster than the pure Python one, when PyYAML is built with it.
+PARSER_BASES = (yaml.cyaml.CParser,) if yaml.__with_libyaml__ else (Reader, Scanner, Parser)
+# Below this number of files, starting the worker processes costs more than it saves.
+PARALLEL_THRESHOLD = 16
+# Mapping keys (the sequences in between not counted) of the values never loaded: the json_schema of the streams
+# is most of a big sync_catalog, and is not used.
+SKIPPED_PATHS = {("configuration", "sync_catalog", "streams", "stream", "json_schema")}
+
+
+# SafeLoader that drops the SKIPPED_PATHS from the parser events: no node, let alone Python object, is built
+# for them. Composer comes first, so its (Python) composition is used over the one of the libyaml parser.
+class ConfigurationLoader(Composer, *PARSER_BASES, SafeConstructor, Resolver):
+    def __init__(self, stream):
+        if yaml.__with_libyaml__:
+            yaml.cyaml.CParser.__init__(self, stream)
+        else:
+            Reader.__init__(self, stream)
+            Scanner.__init__(self)
+            Parser.__init__(self)
+        Composer.__init__(self)
+        SafeConstructor.__init__(self)
+        Resolver.__init__(self)
+        self.path = ()
+
+    def compose_mapping_node(self, anchor):
+        start_event = self.get_event()
+        tag = start_event.tag
+        if tag is None or tag == "!":
+            tag = self.resolve(MappingNode, None, start_event.implicit)
+        node = MappingNode(tag, [], start_event.start_mark, None, flow_style=start_event.flow_style)
+        if anchor is not None:
+            self.anchors[anchor] = node
+        parent_path = self.path
+        while not self.check_event(MappingEndEvent):
+            item_key = self.compose_node(node, None)
+            self.path = parent_path + (item_key.value if isinstance(item_key, ScalarNode) else None,)
+            if self.path in SKIPPED_PATHS:
+                self.skip_node()
+            else:
+                node.value.append((item_key, self.compose_node(node, item_key)))
+            self.path = parent_path
+        node.end_mark = self.get_event().end_mark
+        return node
+
+    def skip_node(self):
+        depth = 0
+        while True:
+            event = self.get_event()
+            if isinstance(event, CollectionStartEvent):
+                depth += 1
+            elif isinstance(event, CollectionEndEvent):
+                depth -= 1
+            if depth == 0:
+                return
+
+
+def find_configurations(folder):
+    configurations = []
+    for root, dirs, files in os.walk(f"{folder}/airbyte/", topdown=True):
+        # Sources first: the connections reference them.
+        dirs.sort(reverse=True)
+        if "configuration.yaml" in files:
+            configurations.append(f"{root}/configuration.yaml")
+    return configurations
+
+
+# What the conversion uses of a stream of a sync_catalog. Everything else is dropped as soon as the configuration
+# is parsed (in the worker process, so it is not even sent back).
+class StreamRecord:
+    __slots__ = ("name", "sync_mode", "destination_sync_mode", "cursor_field", "primary_key")
+
+    def __init__(self, name, sync_mode, destination_sync_mode, cursor_field, primary_key):
+        self.name = name
+        self.sync_mode = sync_mode
+        self.destination_sync_mode = destination_sync_mode
+        self.cursor_field = cursor_field
+        self.primary_key = primary_key
+
+    @classmethod
+    def from_catalog(cls, stream):
+        return cls(
+            stream["stream"]["name"],
+            # A few distinct values repeated in every stream: shared instead of one copy per stream.
+            sys.intern(stream["config"]["sync_mode"]),
+            sys.intern(stream["config"]["destination_sync_mode"]),
+            stream["stream"]["default_cursor_field"],
+            stream["config"]["primary_key"],
+        )
+
+
+def load_configuration(file_path):
+    with open(file_path) as file:
+        content = yaml.load(file, Loader=ConfigurationLoader)
+    if content.get("definition_type") == "connection":
+        sync_catalog = content["configuration"]["sync_catalog"]
+        sync_catalog["streams"] = [StreamRecord.from_catalog(stream) for stream in sync_catalog["streams"]]
+    return content
+
+
+# Yields (file_path, content) in the order of file_paths, whatever the order the workers finish in.
+# An already started executor can be given, to share the worker processes between several calls.
+def read_configurations(file_paths, max_workers=None, executor=None):
+    if len(file_paths) < PARALLEL_THRESHOLD or max_workers == 1:
+        for file_path in file_paths:
+            yield file_path, load_configuration(file_path)
+        return
+    chunksize = max(1, len(file_paths) // (4 * (max_workers or os.cpu_count() or 1)))
+    if executor is not None:
+        yield from zip(file_paths, executor.map(load_configuration, file_paths, chunksize=chunksize))
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        yield from zip(file_paths, executor.map(load_configuration, file_paths, chunksize=chunksize))
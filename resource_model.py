@@ -0,0 +1,26 @@
+from hcl_writer import CommentedOut, Expression
+from tf_cache import fingerprint
+
+
+# Comparable form of a resource: {"name": ..., "configuration.host": ..., "streams[0].name": ..., "streams[]": 3}.
+# Expressions (references to variables or other resources) are not comparable and left out, as well as
+# the attributes commented out.
+def model_paths(value, path="", paths=None):
+    if paths is None:
+        paths = {}
+    if isinstance(value, (Expression, CommentedOut)):
+        return paths
+    if isinstance(value, dict):
+        for key, item in value.items():
+            model_paths(item, f"{path}.{key}" if path else key, paths)
+    elif isinstance(value, (list, tuple)):
+        paths[f"{path}[]"] = len(value)
+        for index, item in enumerate(value):
+            model_paths(item, f"{path}[{index}]", paths)
+    else:
+        paths[path] = value
+    return paths
+
+
+def model_hash(paths):
+    return fingerprint(sorted(paths.items()))
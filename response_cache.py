@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+INDEX_FILE = "index.json"
+
+
+# Response body replayed from the cache, with the attributes of requests.Response used by AirbyteHelper.
+class CachedResponse:
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def close(self):
+        pass
+
+
+# Responses of the read endpoints, kept on disk between runs: one gzipped file per response,
+# and an index of their expiry, ETag and size, evicted least recently used first above max_size.
+# The last use of an entry is the modification time of its file, touched when it is read: kept between runs
+# without writing the index. Only the index is under the lock, the files are read and written outside of it.
+class ResponseCache:
+    def __init__(self, folder, ttl=3600, max_size=512 * 1024 * 1024):
+        self.folder = folder
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        try:
+            with open(os.path.join(folder, INDEX_FILE), encoding="utf-8") as file:
+                self.index = json.load(file)
+        except (OSError, ValueError):
+            self.index = {}
+        self.last_used = {}
+        for key in list(self.index):
+            try:
+                self.last_used[key] = os.path.getmtime(self.entry_path(key))
+            except OSError:
+                del self.index[key]
+
+    @staticmethod
+    def make_key(base_url, url_path, data):
+        return hashlib.sha256(json.dumps([base_url, url_path, data], sort_keys=True).encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.folder, f"{key}.gz")
+
+    # Returns (entry, content): entry is None when nothing is cached, and content is None when it has expired.
+    def get(self, key):
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None, None
+            entry = dict(entry)
+        now = time.time()
+        try:
+            with gzip.open(self.entry_path(key), "rb") as file:
+                content = file.read()
+            os.utime(self.entry_path(key), (now, now))
+        except OSError:
+            with self.lock:
+                if key in self.index:
+                    del self.index[key]
+                    self.last_used.pop(key, None)
+            return None, None
+        with self.lock:
+            if key in self.index:
+                self.last_used[key] = now
+        if entry["expires"] < now:
+            return entry, None
+        return entry, content
+
+    def put(self, key, base_url, url_path, content, etag=None):
+        # One temporary file per thread: os.replace makes the last one written the entry.
+        tmp_path = f"{self.entry_path(key)}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=1) as file:
+            file.write(content)
+        size = os.path.getsize(tmp_path)
+        now = time.time()
+        os.utime(tmp_path, (now, now))
+        with self.lock:
+            os.replace(tmp_path, self.entry_path(key))
+            self.index[key] = {
+                "base_url": base_url,
+                "url_path": url_path,
+                "etag": etag,
+                "size": size,
+                "expires": now + self.ttl,
+            }
+            self.last_used[key] = now
+            self.evict()
+            self.save_index()
+
+    # Revalidated by the server (304 Not Modified): kept for another ttl.
+    def refresh(self, key):
+        with self.lock:
+            if key in self.index:
+                self.index[key]["expires"] = time.time() + self.ttl
+                self.save_index()
+
+    # Drops the entries of base_url whose endpoint starts with one of the prefixes.
+    def invalidate(self, base_url, prefixes):
+        with self.lock:
+            keys = [
+                key for key, entry in self.index.items()
+                if entry["base_url"] == base_url and entry["url_path"].startswith(tuple(prefixes))
+            ]
+            for key in keys:
+                self.remove(key)
+            if keys:
+                self.save_index()
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.index):
+                self.remove(key)
+            self.save_index()
+
+    def remove(self, key):
+        del self.index[key]
+        self.last_used.pop(key, None)
+        try:
+            os.remove(self.entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        total_size = sum(entry["size"] for entry in self.index.values())
+        for key in sorted(self.index, key=lambda key: self.last_used.get(key, 0)):
+            if total_size <= self.max_size:
+                break
+            total_size -= self.index[key]["size"]
+            self.remove(key)
+
+    def save_index(self):
+        path = os.path.join(self.folder, INDEX_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(self.index, file)
+        os.replace(path + ".tmp", path)
@@ -0,0 +1,54 @@
+import gzip
+import json
+import logging
+import os
+import sys
+
+from airbyte_inventory import RESOURCE_TYPES, AirbyteInventory
+from tracing import instrumented_from_env
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+# Remote state needed by the conversion (Airbyte inventory, GitHub secrets names), as gzipped JSON.
+def save_snapshot(path, git_organization, inventory, gh_secrets):
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "git_organization": git_organization,
+        "inventory": {resource_type: getattr(inventory, resource_type) for resource_type in RESOURCE_TYPES},
+        "gh_secrets": gh_secrets,
+    }
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as file:
+        json.dump(snapshot, file, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        snapshot = json.load(file)
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise Exception(f"Unsupported snapshot version {snapshot.get('version')} in {path}")
+    return snapshot["git_organization"], AirbyteInventory(**snapshot["inventory"]), snapshot["gh_secrets"]
+
+
+def dump_snapshot(path, dp_names):
+    from generate_tf import Migrator
+
+    migrator = Migrator.from_env()
+    inventory = migrator.load_inventory()
+    gh_secrets = {}
+    for dp_name in dp_names:
+        repo = migrator.get_repo(dp_name)
+        gh_secrets[repo] = [secret["name"] for secret in migrator.get_gh_secrets(repo)["secrets"]]
+    save_snapshot(path, migrator.git_organization, inventory, gh_secrets)
+    logger.info("Snapshot of %s data products written to %s", len(dp_names), path)
+
+
+if __name__ == "__main__":
+    # python snapshot.py airbyte_snapshot.json.gz <data product>...
+    # then: SNAPSHOT=airbyte_snapshot.json.gz python generate_tf.py
+    with instrumented_from_env():
+        dump_snapshot(sys.argv[1], sys.argv[2:] or os.environ["DP_NAMES"].split(","))
@@ -0,0 +1,111 @@
+import asyncio
+
+import httpx
+import pytest
+
+from airbyte_helper import AirbyteApiError
+from airbyte_inventory import load_inventory_async
+from async_airbyte_helper import AsyncAirbyteHelper
+
+
+# Mock Airbyte API: responses[url path] is a list of what to return on each call, a status code, an exception
+# (raised) or a payload. The last one is repeated. The paths called are in calls.
+class MockApi:
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def __call__(self, request):
+        url_path = request.url.path.removeprefix("/api")
+        self.calls.append(url_path)
+        found = self.responses[url_path]
+        response = found.pop(0) if len(found) > 1 else found[0]
+        if isinstance(response, Exception):
+            raise response
+        if isinstance(response, int):
+            headers = {"Retry-After": "0"} if response == 429 else {}
+            return httpx.Response(response, headers=headers, json={"message": "failed"})
+        return httpx.Response(200, json=response)
+
+    def helper(self):
+        return AsyncAirbyteHelper("http://airbyte", "id", "secret", backoff_factor=0,
+                                  transport=httpx.MockTransport(self))
+
+
+def run(api, call):
+    async def main():
+        async with api.helper() as helper:
+            return await call(helper)
+    return asyncio.run(main())
+
+
+def test_load_inventory_async():
+    apis = {
+        env: MockApi({
+            "/v1/workspaces/list": [{"workspaces": [{"workspaceId": f"{env}-workspace"}]}],
+            "/v1/destinations/list": [{"destinations": [{"destinationId": f"{env}-d", "name": "BigQuery"}]}],
+            "/v1/sources/list": [503, {"sources": [{"sourceId": f"{env}-s", "name": "Source"}]}],
+            "/v1/connections/list": [{"connections": []}],
+        })
+        for env in ["dev", "prod"]
+    }
+
+    async def main():
+        helpers = {env: api.helper() for env, api in apis.items()}
+        try:
+            return await load_inventory_async(helpers)
+        finally:
+            for helper in helpers.values():
+                await helper.close()
+
+    inventory = asyncio.run(main())
+    assert inventory.sources == {env: [{"sourceId": f"{env}-s", "name": "Source"}] for env in apis}
+    assert inventory.find_by_name("destinations", "BigQuery")["prod"][0]["destinationId"] == "prod-d"
+    assert apis["dev"].calls.count("/v1/sources/list") == 2
+
+
+@pytest.mark.parametrize("failure", [
+    500, 503, 429, httpx.ReadTimeout("timeout"), httpx.ReadError("reset"), httpx.ConnectError("refused")
+])
+def test_read_only_endpoints_retried(failure):
+    api = MockApi({"/v1/sources/get": [failure, failure, {"sourceId": "s"}]})
+    assert run(api, lambda helper: helper.get_source("s")) == {"sourceId": "s"}
+    assert len(api.calls) == 3
+
+
+def test_retries_limited():
+    api = MockApi({"/v1/sources/get": [httpx.ReadTimeout("timeout")]})
+    with pytest.raises(httpx.ReadTimeout):
+        run(api, lambda helper: helper.get_source("s"))
+    assert len(api.calls) == 4
+
+
+@pytest.mark.parametrize("failure, error", [
+    (500, AirbyteApiError), (503, AirbyteApiError), (httpx.ReadTimeout("timeout"), httpx.ReadTimeout),
+    (httpx.ReadError("reset"), httpx.ReadError),
+])
+def test_mutations_not_retried(failure, error):
+    api = MockApi({"/v1/connections/sync": [failure, {"job": {"id": 1}}]})
+    with pytest.raises(error):
+        run(api, lambda helper: helper.trigger_connection_sync("c"))
+    assert api.calls == ["/v1/connections/sync"]
+
+
+# Not applied by the server: a 429 with a Retry-After, or a request never sent.
+@pytest.mark.parametrize("failure", [429, httpx.ConnectError("refused"), httpx.ConnectTimeout("timeout")])
+def test_mutations_retried_when_not_applied(failure):
+    api = MockApi({"/v1/connections/sync": [failure, {"job": {"id": 1}}]})
+    assert run(api, lambda helper: helper.trigger_connection_sync("c")) == {"job": {"id": 1}}
+    assert len(api.calls) == 2
+
+
+def test_run_bulk():
+    api = MockApi({"/v1/connections/sync": [{"job": {"id": 1}}], "/v1/connections/delete": [500]})
+
+    async def call(helper):
+        syncs = await helper.trigger_syncs(["a", "b"], max_workers=1)
+        deletions = await helper.delete_connections(["c"], max_workers=1)
+        return syncs, deletions
+
+    syncs, deletions = run(api, call)
+    assert [(result.item, result.ok) for result in syncs + deletions] == [("a", True), ("b", True), ("c", False)]
@@ -0,0 +1,35 @@
+from drift_check import check_drift
+
+
+# The fake APIs serve the resources the data product was generated from: in sync.
+def test_in_sync(data_product):
+    migration = data_product.migration()
+    migration.run()
+    models = migration.models
+    assert {model["resource_type"] for model in models.values()} == {"destinations", "sources", "connections"}
+    assert check_drift(models, migration.migrator.airbyte_helpers) == {}
+
+
+def test_drift(data_product):
+    migration = data_product.migration()
+    migration.run()
+    resources = data_product.resources
+    resources["sources"]["prod"][1]["connectionConfiguration"]["host"] = "other.example.com"
+    stream = resources["connections"]["dev"][2]["syncCatalog"]["streams"][0]
+    stream["config"]["syncMode"] = "full_refresh"
+    stream["config"]["destinationSyncMode"] = "append"
+
+    models = migration.models
+    drift = check_drift(models, migration.migrator.airbyte_helpers)
+    source_path, = [tf_path for tf_path, model in models.items() if model["remote_ids"]["prod"] == "prod-source-1"]
+    connection_path, = [
+        tf_path for tf_path, model in models.items() if model["remote_ids"]["dev"] == "dev-connection-2"
+    ]
+    assert drift == {
+        source_path: {"prod": [("configuration.host", "db-1.example.com", "other.example.com")]},
+        connection_path: {"dev": [(
+            "configurations.streams[0].sync_mode",
+            models[connection_path]["paths"]["configurations.streams[0].sync_mode"],
+            "full_refresh_append",
+        )]},
+    }
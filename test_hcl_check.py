@@ -0,0 +1,79 @@
+import pytest
+
+from conversion_rules import RULES
+from hcl_check import HclChecker, HclError
+from hcl_writer import CommentedOut, Expression
+from tf_document import ResourceBlock, VariableBlock
+
+# Values of Octavia configurations, secrets included, with what is special in HCL strings.
+CONFIGURATIONS = [
+    {"hosts": ["${HOST}:1", ["b"]]},
+    {"url": "https://${HOST}/${PATH}?a=${A}", "port": 5432},
+    {"dollars": "x$$y", "percents": "p%%{q}", "mixed": "$%${SECRET}$", "end": "a$"},
+    {"literal": "${}", "template": "%{ if true }", "braces": "{[(", "commas": ",,"},
+    {"quote": 'a "b" ${SECRET} "c"', "backslash": "a\\", "lines": "a\nb\tc"},
+    {"key\n": 1, "$key": 2, "a.b": 3, "nested": {"list": [{"x": "${SECRET}"}, {"y": ["]", "}"]}]}},
+    {"empty": {}, "empty_list": [], "none": None, "flag": True, "ratio": 0.5},
+]
+
+
+@pytest.mark.parametrize("configuration", CONFIGURATIONS)
+def test_accepts_hcl_writer_output(configuration):
+    content = RULES.convert_source({
+        "definition_id": "id", "configuration": configuration, "name": "n", "workspace_id": Expression("var.WS")
+    })
+    rendered = ResourceBlock("airbyte_source_postgres", "n", content).render()
+    assert HclChecker()(rendered) == rendered
+
+
+def test_accepts_multi_line_lists():
+    rendered = ResourceBlock("t", "n", {"items": [{"a": "${"}, {"b": CommentedOut("}")}]}).render()
+    assert HclChecker()(rendered) == rendered
+
+
+@pytest.mark.parametrize("content", [
+    'resource "t" "n" {\n  a = [1, 2\n}',
+    'resource "t" "n" {\n  a = "b\n}',
+    'resource "t" "n" {\n  a = ["${var.X]"]\n}',
+    'resource "t" "n" {\n  a = [\n    1\n    2,\n  ]\n}',
+    'resource "t" "n" {\n  a = [1,, 2]\n}',
+])
+def test_rejects_invalid_hcl(content):
+    with pytest.raises(HclError):
+        HclChecker()(content)
+
+
+def test_undeclared_variables():
+    checker = HclChecker(strict=True)
+    checker(VariableBlock("HOST", "host").render())
+    content = RULES.convert_source({"configuration": {"host": "${HOST}"}, "name": "n"})
+    checker(ResourceBlock("t", "n", content).render())
+    content = RULES.convert_source({"configuration": {"url": "https://${HOST}/${PATH}"}, "name": "n"})
+    with pytest.raises(HclError, match="PATH"):
+        checker(ResourceBlock("t", "n", content).render())
+
+
+def test_recorded_variables_checked_again():
+    checker = HclChecker(strict=True)
+    checker(VariableBlock("HOST", "host").render())
+    content = RULES.convert_source({"configuration": {"host": "${HOST}", "literal": "$${PORT}"}, "name": "n"})
+    with checker.record() as variables:
+        checker(ResourceBlock("t", "n", content).render())
+    assert variables == {"HOST"}
+    checker.check_variables("cached", variables)
+    with pytest.raises(HclError, match="HOST"):
+        HclChecker(strict=True).check_variables("cached", variables)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("${HOST}", "var.HOST"),
+    ("https://${HOST}:%{port}/${var.PATH}", '"https://${var.HOST}:%%{port}/${var.PATH}"'),
+    ("${HOST}${ not a secret", '"${var.HOST}$${ not a secret"'),
+    ('${HOST}/${"quoted"}\n${a b}', '"${var.HOST}/$${\\"quoted\\"}\\n$${a b}"'),
+    ("${ HOST }", '"$${ HOST }"'),
+])
+def test_mixed_literal_and_secret_strings(value, expected):
+    content = RULES.convert_source({"configuration": {"value": value}, "name": "n"})
+    rendered = ResourceBlock("t", "n", content).render()
+    assert f"value = {expected}\n" in rendered
+    assert HclChecker()(rendered) == rendered
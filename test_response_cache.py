@@ -0,0 +1,121 @@
+import json
+import os
+
+import pytest
+
+import response_cache
+from airbyte_helper import AirbyteHelper
+from response_cache import ResponseCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    found = Clock()
+    monkeypatch.setattr(response_cache.time, "time", found)
+    return found
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", etag=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {"ETag": etag} if etag else {}
+
+    def json(self):
+        return json.loads(self.content)
+
+
+# AirbyteHelper with a response cache, whose calls to the API are replaced by responses(url_path, headers).
+def make_helper(folder, responses, ttl=60):
+    helper = AirbyteHelper("http://airbyte", "id", "secret", response_cache=ResponseCache(folder, ttl=ttl))
+    helper.calls = []
+
+    def post(url_path, data, headers=None, stream=False):
+        helper.calls.append((url_path, headers or {}))
+        return responses(url_path, headers or {})
+
+    helper.post = post
+    return helper
+
+
+def test_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    cache.put("key", "http://airbyte", "/v1/sources/get", b"content", etag="v1")
+    clock.now += 59
+    assert cache.get("key") == ({**cache.index["key"]}, b"content")
+    clock.now += 2
+    entry, content = cache.get("key")
+    assert (entry["etag"], content) == ("v1", None)
+    # Kept between runs:
+    assert ResponseCache(str(tmp_path), ttl=60).get("key")[0]["etag"] == "v1"
+    assert cache.get("other key") == (None, None)
+
+
+def test_etag_revalidation(tmp_path, clock):
+    def responses(url_path, headers):
+        if headers.get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, b'{"sourceId": "s"}', etag='"v1"')
+
+    helper = make_helper(str(tmp_path), responses)
+    assert helper.get_source("s") == {"sourceId": "s"}
+    assert helper.get_source("s") == {"sourceId": "s"}
+    assert helper.calls == [("/v1/sources/get", {})]
+    clock.now += 61
+    assert helper.get_source("s") == {"sourceId": "s"}
+    assert helper.calls[1] == ("/v1/sources/get", {"If-None-Match": '"v1"'})
+    # Refreshed by the 304: fresh for another ttl.
+    clock.now += 59
+    assert helper.get_source("s") == {"sourceId": "s"}
+    assert len(helper.calls) == 2
+
+
+def test_lru_eviction_across_runs(tmp_path, clock):
+    folder = str(tmp_path)
+    content = os.urandom(1000)
+    cache = ResponseCache(folder, max_size=3500)
+    for key in ["a", "b", "c"]:
+        clock.now += 1
+        cache.put(key, "http://airbyte", "/v1/sources/get", content)
+    # A run that only reads:
+    clock.now += 1
+    assert ResponseCache(folder, max_size=3500).get("a")[1] == content
+
+    cache = ResponseCache(folder, max_size=3500)
+    clock.now += 1
+    cache.put("d", "http://airbyte", "/v1/sources/get", content)
+    assert sorted(cache.index) == ["a", "c", "d"]
+    assert not os.path.exists(cache.entry_path("b"))
+
+
+def test_invalidation_after_mutation(tmp_path, clock):
+    def responses(url_path, headers):
+        if url_path == "/v1/sources/delete":
+            return FakeResponse(204, b"{}")
+        if url_path == "/v1/workspaces/list":
+            return FakeResponse(200, b'{"workspaces": [{"workspaceId": "w"}]}')
+        return FakeResponse(200, b'{"sourceId": "s", "connections": []}')
+
+    helper = make_helper(str(tmp_path), responses)
+    for _ in range(2):
+        helper.get_source("s")
+        helper.list_connections("w")
+        helper.list_workspaces()
+    assert len(helper.calls) == 3
+    helper.delete_source("s")
+    helper.get_source("s")
+    helper.list_connections("w")
+    helper.invalidate_workspace_cache()
+    helper.list_workspaces()
+    # The sources and the connections were invalidated, not the workspaces:
+    assert [url_path for url_path, _ in helper.calls[3:]] == [
+        "/v1/sources/delete", "/v1/sources/get", "/v1/connections/list"
+    ]
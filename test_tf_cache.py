@@ -0,0 +1,99 @@
+import json
+import os
+
+import pytest
+import yaml
+
+import tf_cache
+from tf_cache import CACHE_VERSION, ConversionCache
+
+# 4 sources and 4 connections:
+N_CONFIGURATIONS = 8
+
+
+def run(data_product):
+    migration = data_product.migration()
+    migration.run()
+    with open(migration.document.path) as file:
+        return migration, file.read()
+
+
+def test_cache_file(tmp_path):
+    path = f"{tmp_path}/main.tf.cache.json"
+    cache = ConversionCache(path, "fingerprint")
+    cache.put("a.yaml", "key-a", [["resource", 'resource "t" "a" {\n  b = "\\t"\n}', None]], {"id": "t.a"}, {}, [])
+    cache.put("b.yaml", "key-b", [], {}, {}, ["SECRET"])
+    cache.save()
+    with open(path) as file:
+        lines = file.read().splitlines()
+    assert json.loads(lines[0]) == {"version": CACHE_VERSION, "fingerprint": "fingerprint"}
+    assert [json.loads(line.split("\t")[0]) for line in lines[1:]] == [["a.yaml", "key-a"], ["b.yaml", "key-b"]]
+
+    cache = ConversionCache(path, "fingerprint")
+    assert cache.get("a.yaml", "other key") is None
+    assert cache.get("b.yaml", "key-b")["variables"] == ["SECRET"]
+    assert cache.get("a.yaml", "key-a")["blocks"] == [["resource", 'resource "t" "a" {\n  b = "\\t"\n}', None]]
+    # Streamed to the next cache file as they are used:
+    assert os.path.exists(f"{path}.tmp")
+    cache.save()
+    assert not os.path.exists(f"{path}.tmp")
+    # Only the entries used by the last run are kept, in the order they were used:
+    assert [key for key, _, _ in ConversionCache(path, "fingerprint").entries.values()] == ["key-b", "key-a"]
+    assert ConversionCache(path, "other fingerprint").entries == {}
+
+
+def test_hit_and_miss_across_runs(data_product):
+    migration, first = run(data_product)
+    assert (migration.cache.hits, migration.cache.misses) == (0, N_CONFIGURATIONS)
+    migration, second = run(data_product)
+    assert (migration.cache.hits, migration.cache.misses) == (N_CONFIGURATIONS, 0)
+    assert second == first
+
+    data_product.edit("sources", 2, "db-2.example.com", "db-2b.example.com")
+    migration, third = run(data_product)
+    assert (migration.cache.hits, migration.cache.misses) == (N_CONFIGURATIONS - 1, 1)
+    assert third == first.replace("db-2.example.com", "db-2b.example.com")
+
+
+# The connections reference the sources by their Terraform path.
+def test_source_tf_path_change(data_product):
+    _, first = run(data_product)
+    assert "airbyte_source_github.source_1.source_id" in first
+    data_product.edit("sources", 1, "airbyte/source-github", "airbyte/source-postgres")
+    migration, second = run(data_product)
+    assert (migration.cache.hits, migration.cache.misses) == (3, 5)
+    assert "airbyte_source_github.source_1" not in second
+    assert "airbyte_source_postgres.source_1.source_id" in second
+
+
+def test_version_change(data_product, monkeypatch):
+    run(data_product)
+    monkeypatch.setattr(tf_cache, "CACHE_VERSION", CACHE_VERSION + 1)
+    migration, _ = run(data_product)
+    assert (migration.cache.hits, migration.cache.misses) == (0, N_CONFIGURATIONS)
+
+
+def test_inventory_change(data_product):
+    run(data_product)
+    data_product.resources["connections"]["prod"][0]["status"] = "inactive"
+    migration, _ = run(data_product)
+    assert (migration.cache.hits, migration.cache.misses) == (0, N_CONFIGURATIONS)
+
+
+def test_next_run_after_failed_conversion(data_product):
+    migration, first = run(data_product)
+    migration.reset()
+    data_product.edit("connections", 1, "status: active", "status: [")
+    with pytest.raises(yaml.YAMLError):
+        migration.convert(checkout=False)
+    migration.reset()
+    assert not os.path.exists(f"{migration.cache.path}.tmp")
+    with open(migration.document.path) as file:
+        assert file.read() == first
+
+    data_product.edit("connections", 1, "status: [", "status: inactive")
+    migration.convert(checkout=False)
+    migration.render()
+    assert (migration.cache.hits, migration.cache.misses) == (N_CONFIGURATIONS - 1, 1)
+    migration, _ = run(data_product)
+    assert (migration.cache.hits, migration.cache.misses) == (N_CONFIGURATIONS, 0)
@@ -0,0 +1,72 @@
+import os
+import re
+
+from tf_document import ResourceBlock, SplitTfDocument, TfDocument, VariableBlock
+
+
+def write_document(document, sources):
+    document.add(VariableBlock("HOST", "host"))
+    document.add("terraform {}")
+    for source in sources:
+        with document.section(f"source_{source}.tf"):
+            document.add(ResourceBlock("airbyte_source_postgres", source, {"name": source}))
+    document.close()
+    return document
+
+
+def read(path):
+    with open(path) as file:
+        return file.read()
+
+
+def test_document_replaced_when_closed(tmp_path):
+    path = f"{tmp_path}/main.tf"
+    write_document(TfDocument(path), ["a"])
+    first = read(path)
+    with TfDocument(path) as document:
+        document.add("terraform {}")
+        document.discard()
+    assert read(path) == first
+    assert not os.path.exists(f"{path}.tmp")
+
+
+def test_split_layout(tmp_path):
+    document = write_document(SplitTfDocument(str(tmp_path)), ["a", "b"])
+    assert sorted(os.listdir(tmp_path)) == ["main.tf", "source_a.tf", "source_b.tf", "variables.tf"]
+    assert read(f"{tmp_path}/variables.tf").startswith('variable "HOST" {')
+    assert read(f"{tmp_path}/main.tf") == "terraform {}\n"
+    assert read(f"{tmp_path}/source_b.tf") == 'resource "airbyte_source_postgres" "b" {\n  name = "b"\n}\n'
+    assert len(document.rewritten) == 4
+
+
+def test_split_rerun(tmp_path):
+    write_document(SplitTfDocument(str(tmp_path)), ["a", "b"])
+    with open(f"{tmp_path}/extra.tf", "w") as file:
+        file.write("# written by hand\n")
+    os.utime(f"{tmp_path}/source_a.tf", (0, 0))
+
+    document = write_document(SplitTfDocument(str(tmp_path)), ["a"])
+    assert document.rewritten == []
+    assert document.summary().endswith("(0 files rewritten)")
+    # Unchanged files are not written again, the files of the sources removed are deleted, the others kept:
+    assert os.path.getmtime(f"{tmp_path}/source_a.tf") == 0
+    assert sorted(os.listdir(tmp_path)) == ["extra.tf", "main.tf", "source_a.tf", "variables.tf"]
+
+    document = write_document(SplitTfDocument(str(tmp_path)), ["a", "c"])
+    assert document.rewritten == [f"{tmp_path}/source_c.tf"]
+
+
+def test_split_data_product_rerun(data_product):
+    migration = data_product.migration(split_output=True)
+    migration.run()
+    assert len(migration.document.rewritten) == len(os.listdir(data_product.output_folder)) - 1
+    assert os.path.exists(f"{data_product.output_folder}/source_source_3.tf")
+    # In the same order whatever the run (and its PYTHONHASHSEED):
+    variables = re.findall(r'^variable "(\w+)"', read(f"{data_product.output_folder}/variables.tf"), re.MULTILINE)
+    secrets = variables[:variables.index("AIRBYTE_URL")]
+    assert secrets == sorted(secrets) and "DB_PASSWORD_3" in secrets
+
+    migration = data_product.migration(split_output=True)
+    migration.run()
+    assert migration.document.rewritten == []
+    assert "(0 files rewritten)" in migration.document.summary()
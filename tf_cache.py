@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+CACHE_VERSION = 5
+
+
+def fingerprint(*values):
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode()).hexdigest()
+
+
+def file_hash(file_path):
+    return hashlib.sha256(Path(file_path).read_bytes()).hexdigest()
+
+
+# Any change in the converter itself invalidates the cache.
+def code_fingerprint():
+    return fingerprint(*[file_hash(path) for path in sorted(Path(__file__).parent.glob("*.py"))])
+
+
+# HCL blocks generated for each configuration.yaml, stored next to main.tf, so a re-run only converts the
+# configurations whose key changed. The whole cache is dropped when its fingerprint (converter code, remote
+# inventory...) changes.
+# One line per configuration: `[file_path, key]<TAB>entry` (JSON never has a raw tab). Only the position of the
+# lines is kept in memory, an entry is read when replayed, and the entries of the run are streamed to the new
+# cache file: the memory used does not grow with the size of the document.
+class ConversionCache:
+    def __init__(self, path, cache_fingerprint):
+        self.path = path
+        self.fingerprint = cache_fingerprint
+        # file_path => (key, offset, length) of its line in the cache file, and in the one being written:
+        self.entries = {}
+        self.used_entries = {}
+        self.reader = None
+        self.writer = None
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(path):
+            self.entries = self.read_index()
+
+    def read_index(self):
+        index = {}
+        with open(self.path, "rb") as file:
+            header = json.loads(file.readline() or b"{}")
+            if header.get("version") != CACHE_VERSION or header.get("fingerprint") != self.fingerprint:
+                return {}
+            offset = file.tell()
+            for line in file:
+                file_path, key = json.loads(line[:line.index(b"\t")])
+                index[file_path] = (key, offset, len(line))
+                offset += len(line)
+        return index
+
+    def contains(self, file_path, key):
+        found = self.entries.get(file_path)
+        return found is not None and found[0] == key
+
+    def get(self, file_path, key):
+        if not self.contains(file_path, key):
+            return None
+        _, offset, length = self.entries[file_path]
+        if self.reader is None:
+            self.reader = open(self.path, "rb")
+        self.reader.seek(offset)
+        line = self.reader.read(length)
+        self.write_line(file_path, key, line)
+        self.hits += 1
+        return json.loads(line[line.index(b"\t") + 1:])
+
+    def put(self, file_path, key, blocks, tf_paths, models, variables):
+        entry = {"blocks": blocks, "tf_paths": tf_paths, "models": models, "variables": variables}
+        line = (json.dumps([file_path, key]) + "\t" + json.dumps(entry) + "\n").encode()
+        self.write_line(file_path, key, line)
+        self.misses += 1
+
+    def write_line(self, file_path, key, line):
+        if self.writer is None:
+            self.writer = open(f"{self.path}.tmp", "wb")
+            self.writer.write(json.dumps({"version": CACHE_VERSION, "fingerprint": self.fingerprint}).encode() + b"\n")
+        self.used_entries[file_path] = (key, self.writer.tell(), len(line))
+        self.writer.write(line)
+
+    def close_reader(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    # In a long-running process (see watch.py): what a failed conversion wrote is dropped, the next one looks up
+    # the entries of the last saved cache.
+    def next_run(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            os.remove(f"{self.path}.tmp")
+        self.used_entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def save(self):
+        self.close_reader()
+        if self.writer is None:
+            self.write_line(None, None, b"")
+            self.used_entries = {}
+        self.writer.close()
+        self.writer = None
+        os.replace(f"{self.path}.tmp", self.path)
+        self.entries = self.used_entries
+        self.used_entries = {}
@@ -0,0 +1,231 @@
+import glob
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from hcl_writer import to_hcl
+from tracing import TRACER
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+
+class TfBlock:
+    kind = "raw"
+
+    def __init__(self, content):
+        self.content = content
+
+    def render(self):
+        return self.content.strip()
+
+
+class ProviderBlock(TfBlock):
+    kind = "provider"
+
+    def __init__(self, name, body):
+        super().__init__(body)
+        self.name = name
+
+    def render(self):
+        return f'provider "{self.name}" {self.content.strip()}'
+
+
+class VariableBlock(TfBlock):
+    kind = "variable"
+
+    def __init__(self, name, description, sensitive=False):
+        super().__init__(None)
+        self.name = name
+        self.description = description
+        self.sensitive = sensitive
+
+    def render(self):
+        if self.sensitive:
+            attributes = f'  description = "{self.description}"\n  sensitive   = true\n'
+        else:
+            attributes = f'  description = "{self.description}"\n'
+        return f'variable "{self.name}" {{\n{attributes}}}'
+
+
+class ImportBlock(TfBlock):
+    kind = "import"
+
+    def __init__(self, tf_path, remote_ids):
+        super().__init__(None)
+        self.tf_path = tf_path
+        # remote_ids: env -> remote id, e.g. {"dev": "...", "prod": "..."}
+        self.remote_ids = remote_ids
+
+    def render(self):
+        return f"""import {{
+  for_each = toset(var.ENV == "dev" ? [{{ unique_id = "{self.remote_ids["dev"]}" }}] : [{{ unique_id = "{self.remote_ids["prod"]}" }}]) # noqa
+  to       = {self.tf_path}
+  id       = each.value.unique_id
+}}"""
+
+
+# body: either the attributes of the resource, or its HCL body as text.
+class ResourceBlock(TfBlock):
+    kind = "resource"
+
+    def __init__(self, tf_type, name, body):
+        super().__init__(body)
+        self.tf_type = tf_type
+        self.name = name
+
+    @property
+    def tf_path(self):
+        return f"{self.tf_type}.{self.name}"
+
+    def render(self):
+        body = to_hcl(self.content) if isinstance(self.content, dict) else self.content.strip()
+        return f'resource "{self.tf_type}" "{self.name}" {body}'
+
+
+# Streams the blocks to disk as they are added: only the block being written is held in memory.
+# post_process is applied on the rendered text of each block, before it is written.
+# The blocks go to a temporary file, moved to path when closed: a failed conversion leaves the previous file.
+class TfDocument:
+    def __init__(self, path, post_process=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.path = path
+        self.post_process = post_process
+        self.buffer_size = buffer_size
+        self.counts = Counter()
+        self.file = None
+        self.recording = None
+        # File of the blocks added in the current section(), when the document is split.
+        self.file_name = None
+
+    def open(self):
+        if self.file is None:
+            self.file = open(f"{self.path}.tmp", "w", encoding="utf-8", buffering=self.buffer_size)
+        return self
+
+    def add(self, block):
+        if isinstance(block, str):
+            block = TfBlock(block)
+        with TRACER.span("render", "render"):
+            content = block.render()
+        if self.post_process is not None:
+            with TRACER.span("post_process", "render"):
+                content = self.post_process(content)
+        self.write(content, block.kind, self.file_name)
+
+    # Writes an already rendered and post processed block.
+    def write(self, content, kind, file_name=None):
+        self.write_block(content, kind, file_name)
+        self.counts[kind] += 1
+        if self.recording is not None:
+            self.recording.append((kind, content, file_name))
+
+    def write_block(self, content, kind, file_name):
+        self.open()
+        if sum(self.counts.values()) > 0:
+            self.file.write("\n")
+        self.file.write(content + "\n")
+
+    # Blocks added in the `with` statement go to file_name, when the document is split.
+    @contextmanager
+    def section(self, file_name):
+        previous_file_name = self.file_name
+        self.file_name = file_name
+        try:
+            yield
+        finally:
+            self.file_name = previous_file_name
+
+    # Collects the (kind, content, file_name) of the blocks written in the `with` statement.
+    @contextmanager
+    def record(self):
+        self.recording = []
+        try:
+            yield self.recording
+        finally:
+            self.recording = None
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            os.replace(f"{self.path}.tmp", self.path)
+
+    # Drops what was written, the previous file is kept.
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            os.remove(f"{self.path}.tmp")
+
+    def summary(self):
+        return ", ".join(f"{count} {kind}" for kind, count in sorted(self.counts.items()))
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+# Rewrites path (atomically) only when its content changes: unchanged files keep their mtime.
+def write_if_changed(path, content):
+    data = content.encode("utf-8")
+    if os.path.exists(path) and os.path.getsize(path) == len(data):
+        with open(path, "rb") as file:
+            if file.read() == data:
+                return False
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+# Same blocks as TfDocument, split in several files of the folder `path`: the blocks of a section() in the file
+# of the section, variables in variables.tf and everything else in main.tf.
+# The files are kept in memory, and written in parallel when closed.
+class SplitTfDocument(TfDocument):
+    # Files of previous runs matching these patterns are deleted when not generated anymore:
+    SECTION_PATTERNS = ["source_*.tf"]
+
+    def __init__(self, path, post_process=None, max_workers=8):
+        super().__init__(path, post_process)
+        self.max_workers = max_workers
+        self.files = defaultdict(list)
+        self.rewritten = None
+
+    def open(self):
+        return self
+
+    def write_block(self, content, kind, file_name):
+        if file_name is None:
+            file_name = "variables.tf" if kind == "variable" else "main.tf"
+        self.files[file_name].append(content)
+
+    def close(self):
+        if self.rewritten is not None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        contents = {
+            os.path.join(self.path, file_name): "\n\n".join(blocks) + "\n" for file_name, blocks in self.files.items()
+        }
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            changed = executor.map(lambda item: write_if_changed(*item), contents.items())
+            self.rewritten = [path for path, is_changed in zip(contents, changed) if is_changed]
+        for pattern in self.SECTION_PATTERNS:
+            for path in glob.glob(os.path.join(self.path, pattern)):
+                if path not in contents:
+                    os.remove(path)
+        self.files = defaultdict(list)
+
+    def discard(self):
+        self.files = defaultdict(list)
+
+    def summary(self):
+        summary = super().summary()
+        if self.rewritten is not None:
+            summary += f" ({len(self.rewritten)} files rewritten)"
+        return summary
@@ -0,0 +1,146 @@
+import bisect
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Upper bounds of the buckets of the HTTP latency histograms, in milliseconds:
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class Span:
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.record(self.name, self.category, self.start, time.perf_counter(), self.args)
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+# Spans timed in the run, e.g. `with TRACER.span("checkout", dp_name=dp_name):`
+# Categories: "stage" (steps of a migration), "file" (conversion of one configuration), "http" (one API call),
+# "render" (rendering of the blocks). Nothing is recorded until enabled.
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def span(self, name, category="stage", **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, args)
+
+    def record(self, name, category, start, end, args):
+        event = (name, category, start, end, threading.get_ident(), args)
+        with self.lock:
+            self.events.append(event)
+
+    def durations(self, category):
+        found = defaultdict(list)
+        for name, event_category, start, end, _, _ in self.events:
+            if event_category == category:
+                found[name].append(end - start)
+        return found
+
+    def summary(self, slowest_files=20):
+        stages = {}
+        for category in ["stage", "render"]:
+            for name, durations in self.durations(category).items():
+                stages[name] = {"count": len(durations), "seconds": round(sum(durations), 6)}
+        files = sorted(
+            ((name, sum(durations)) for name, durations in self.durations("file").items()),
+            key=lambda found: found[1], reverse=True
+        )
+        return {
+            "stages": stages,
+            "http": {url_path: latency_histogram(durations) for url_path, durations in self.durations("http").items()},
+            "slowest_files": [{"file": name, "seconds": round(seconds, 6)} for name, seconds in files[:slowest_files]],
+        }
+
+    def export_json(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2)
+
+    # Trace Event Format, to open in chrome://tracing or https://ui.perfetto.dev
+    def export_chrome_trace(self, path):
+        trace_events = [
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start - self.origin) * 1e6, 3),
+                "dur": round((end - start) * 1e6, 3),
+                "pid": os.getpid(),
+                "tid": thread_id,
+                "args": args,
+            }
+            for name, category, start, end, thread_id, args in self.events
+        ]
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, file)
+
+
+def latency_histogram(durations):
+    durations = sorted(durations)
+    buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    for duration in durations:
+        buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, duration * 1000)] += 1
+    labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+    return {
+        "count": len(durations),
+        "seconds": round(sum(durations), 6),
+        "p50_ms": round(durations[len(durations) // 2] * 1000, 3),
+        "p95_ms": round(durations[int(len(durations) * 0.95)] * 1000, 3),
+        "max_ms": round(durations[-1] * 1000, 3),
+        "buckets": {label: count for label, count in zip(labels, buckets) if count > 0},
+    }
+
+
+TRACER = Tracer()
+
+
+# Logging and instrumentation of a command, set from the environment:
+#   LOG_LEVEL     DEBUG to list every configuration converted, WARNING to only get the problems (default INFO)
+#   TRACE_JSON    file of the time of the stages, HTTP latency histograms per endpoint and slowest files
+#   TRACE_CHROME  file of all the spans, in the Chrome trace format
+#   PROFILE       file of the cProfile stats of the run (to read with pstats or snakeviz)
+@contextmanager
+def instrumented_from_env():
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+    TRACER.enabled = "TRACE_JSON" in os.environ or "TRACE_CHROME" in os.environ
+    profiler = cProfile.Profile() if "PROFILE" in os.environ else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield TRACER
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.environ["PROFILE"])
+        if "TRACE_JSON" in os.environ:
+            TRACER.export_json(os.environ["TRACE_JSON"])
+        if "TRACE_CHROME" in os.environ:
+            TRACER.export_chrome_trace(os.environ["TRACE_CHROME"])
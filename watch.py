@@ -0,0 +1,197 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+from generate_tf import Migrator
+from octavia_reader import find_configurations
+from tracing import TRACER, instrumented_from_env
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) flags:
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+CONFIGURATION_FILE = "configuration.yaml"
+
+
+# Changes of the configuration.yaml files of a tree, through inotify: every directory of the tree is watched,
+# including the ones created later. Swap and temporary files of the editors are ignored.
+class InotifyWatcher:
+    def __init__(self, folder):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.folders = {}
+        self.add_tree(folder)
+
+    def add_tree(self, folder):
+        for root, _, _ in os.walk(folder):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed on {root}")
+            self.folders[wd] = root
+
+    def read_events(self):
+        changed = set()
+        data = os.read(self.fd, 64 * 1024)
+        position = 0
+        while position < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, position)
+            position += EVENT_HEADER.size
+            name = os.fsdecode(data[position:position + length].rstrip(b"\0"))
+            position += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: everything may have changed.
+                changed.add(None)
+                continue
+            folder = self.folders.get(wd)
+            if folder is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.folders[wd]
+                continue
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and os.path.isdir(path):
+                    self.add_tree(path)
+                    changed.update(find_configurations_below(path))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    changed.add(path)
+            elif name == CONFIGURATION_FILE:
+                changed.add(path)
+        return changed
+
+    # Blocks until a configuration changes, then until no event comes for `debounce` seconds: a burst of changes
+    # (save of several files, checkout of a branch...) is returned at once. None in the set: unknown changes.
+    def wait(self, debounce):
+        changed = set()
+        while len(changed) == 0:
+            select.select([self.fd], [], [])
+            changed.update(self.read_events())
+        while select.select([self.fd], [], [], debounce)[0]:
+            changed.update(self.read_events())
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+# Same as InotifyWatcher, by comparing the modification times every `interval` seconds, where there is no inotify.
+class PollingWatcher:
+    def __init__(self, folder, interval=0.5):
+        self.folder = folder
+        self.interval = interval
+        self.state = self.scan()
+
+    def scan(self):
+        state = {}
+        for root, _, files in os.walk(self.folder):
+            if CONFIGURATION_FILE in files:
+                path = os.path.join(root, CONFIGURATION_FILE)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                state[path] = (stat.st_mtime_ns, stat.st_size)
+        return state
+
+    def poll(self):
+        state = self.scan()
+        changed = {path for path in state.keys() | self.state.keys() if state.get(path) != self.state.get(path)}
+        self.state = state
+        return changed
+
+    def wait(self, debounce):
+        changed = set()
+        while len(changed) == 0:
+            time.sleep(self.interval)
+            changed.update(self.poll())
+        while True:
+            time.sleep(debounce)
+            found = self.poll()
+            if len(found) == 0:
+                return changed
+            changed.update(found)
+
+    def close(self):
+        pass
+
+
+def find_configurations_below(folder):
+    return {os.path.join(root, CONFIGURATION_FILE) for root, _, files in os.walk(folder) if CONFIGURATION_FILE in files}
+
+
+def make_watcher(folder):
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folder)
+        except OSError as e:
+            logger.warning("inotify not available (%s), polling %s instead", e, folder)
+    return PollingWatcher(folder)
+
+
+def convert(migration, checkout=False):
+    try:
+        with TRACER.span("rebuild", dp_name=migration.dp_name):
+            migration.convert(checkout=checkout)
+            migration.render()
+        return True
+    except Exception as e:
+        migration.document.discard()
+        logger.error("Conversion failed, %s left as it was: %s: %s", migration.document.path, type(e).__name__, e)
+        return False
+
+
+# Converts the data product once, then again each time its configurations change: the inventory, the GitHub
+# secrets and the blocks of the unchanged configurations are kept in memory, so only the changed configurations
+# are parsed and converted. A conversion that fails leaves the previous output.
+# The repository is checked out only if it is not there yet: the checkout resets the tree, and would discard
+# the changes being edited.
+def watch(migration, debounce=0.2):
+    checkout = not os.path.exists(migration.folder)
+    if not checkout:
+        logger.info("%s used as is, not checked out again", migration.folder)
+    convert(migration, checkout=checkout)
+    folder = f"{migration.folder}/airbyte"
+    watcher = make_watcher(folder)
+    logger.info("Watching %s (%s configurations)", folder, len(find_configurations(migration.folder)))
+    try:
+        while True:
+            changed = watcher.wait(debounce)
+            start = time.perf_counter()
+            migration.reset()
+            if convert(migration):
+                names = ["(unknown)" if path is None else os.path.relpath(path, folder) for path in changed]
+                logger.info(
+                    "%s changed: %s configurations converted again in %.3fs", ", ".join(sorted(names)),
+                    migration.cache.misses, time.perf_counter() - start
+                )
+    finally:
+        watcher.close()
+
+
+# Usage: DP_NAME=... python watch.py (same settings as generate_tf.py), WATCH_DEBOUNCE in seconds (0.2 by default)
+if __name__ == "__main__":
+    with instrumented_from_env():
+        try:
+            watch(
+                Migrator.from_env().data_product(os.environ["DP_NAME"]),
+                debounce=float(os.environ.get("WATCH_DEBOUNCE", "0.2"))
+            )
+        except KeyboardInterrupt:
+            pass